@@ -0,0 +1,31 @@
+"""bound email id length
+
+Revision ID: 26f2f746b0b4
+Revises: 4c3199c7baf5
+Create Date: 2026-10-14 06:14:37.212102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '26f2f746b0b4'
+down_revision: Union[str, Sequence[str], None] = '4c3199c7baf5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # adding a length limit makes Postgres check every row, run it in a quiet window
+    op.alter_column('emails', 'id', existing_type=sa.String(), type_=sa.String(length=36), existing_nullable=False)
+    op.alter_column('actions', 'email_id', existing_type=sa.String(), type_=sa.String(length=36), existing_nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('actions', 'email_id', existing_type=sa.String(length=36), type_=sa.String(), existing_nullable=False)
+    op.alter_column('emails', 'id', existing_type=sa.String(length=36), type_=sa.String(), existing_nullable=False)
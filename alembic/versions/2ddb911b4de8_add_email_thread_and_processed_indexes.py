@@ -0,0 +1,39 @@
+"""add email thread and processed indexes
+
+Revision ID: 2ddb911b4de8
+Revises: 95c37554ec08
+Create Date: 2026-10-14 05:42:30.870343
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2ddb911b4de8'
+down_revision: Union[str, Sequence[str], None] = '95c37554ec08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_emails_thread_created', 'emails', ['thread_id', sa.text('created_at DESC')],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_emails_processed_created', 'emails', ['processed', sa.text('created_at DESC')],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_emails_processed_created', table_name='emails', postgresql_concurrently=True)
+        op.drop_index('ix_emails_thread_created', table_name='emails', postgresql_concurrently=True)
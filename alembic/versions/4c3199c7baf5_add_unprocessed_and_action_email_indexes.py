@@ -0,0 +1,38 @@
+"""add unprocessed and action email indexes
+
+Revision ID: 4c3199c7baf5
+Revises: fa581fc16ffd
+Create Date: 2026-10-14 06:00:32.585003
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c3199c7baf5'
+down_revision: Union[str, Sequence[str], None] = 'fa581fc16ffd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_emails_unprocessed', 'emails', ['id'], unique=False,
+            postgresql_where=sa.text('processed = false'), postgresql_concurrently=True
+        )
+        op.create_index(
+            op.f('ix_actions_email_id'), 'actions', ['email_id'],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_actions_email_id'), table_name='actions', postgresql_concurrently=True)
+        op.drop_index('ix_emails_unprocessed', table_name='emails', postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""add email search tsvector
+
+Revision ID: 95c37554ec08
+Revises: 4926cb6c3a88
+Create Date: 2026-10-14 05:31:11.497638
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '95c37554ec08'
+down_revision: Union[str, Sequence[str], None] = '4926cb6c3a88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('emails', sa.Column(
+        'search_tsv',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', coalesce(subject, '') || ' ' || coalesce(body, ''))", persisted=True),
+        nullable=True
+    ))
+    op.create_index('ix_emails_search_tsv', 'emails', ['search_tsv'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_emails_search_tsv', table_name='emails', postgresql_using='gin')
+    op.drop_column('emails', 'search_tsv')
@@ -0,0 +1,38 @@
+"""emails updated_at trigger
+
+Revision ID: b0bdecb46512
+Revises: 26f2f746b0b4
+Create Date: 2026-10-14 06:15:50.263777
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b0bdecb46512'
+down_revision: Union[str, Sequence[str], None] = '26f2f746b0b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Postgres stamps updated_at itself, so bulk and raw-SQL updates keep it current too
+    op.execute(
+        "CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$ "
+        "BEGIN NEW.updated_at = now(); RETURN NEW; END; "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER trg_emails_updated_at BEFORE UPDATE ON emails "
+        "FOR EACH ROW EXECUTE FUNCTION set_updated_at()"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_emails_updated_at ON emails")
+    op.execute("DROP FUNCTION IF EXISTS set_updated_at()")
@@ -0,0 +1,38 @@
+"""add email trigram search indexes
+
+Revision ID: b0d7477b445a
+Revises: 2ddb911b4de8
+Create Date: 2026-10-14 05:46:19.867819
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b0d7477b445a'
+down_revision: Union[str, Sequence[str], None] = '2ddb911b4de8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Trigram indexes let the planner serve ILIKE '%...%' on either column
+    op.create_index(
+        'ix_emails_subject_trgm', 'emails', ['subject'], unique=False,
+        postgresql_using='gin', postgresql_ops={'subject': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_emails_body_trgm', 'emails', ['body'], unique=False,
+        postgresql_using='gin', postgresql_ops={'body': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_emails_body_trgm', table_name='emails', postgresql_using='gin')
+    op.drop_index('ix_emails_subject_trgm', table_name='emails', postgresql_using='gin')
@@ -0,0 +1,46 @@
+"""draft attachments jsonb
+
+Revision ID: cac0471035bd
+Revises: b0d7477b445a
+Create Date: 2026-10-14 05:49:06.469787
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cac0471035bd'
+down_revision: Union[str, Sequence[str], None] = 'b0d7477b445a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("UPDATE drafts SET attachments = '[]' WHERE attachments IS NULL")
+    op.alter_column(
+        'drafts', 'attachments',
+        existing_type=sa.JSON(),
+        type_=postgresql.JSONB(),
+        postgresql_using='attachments::jsonb',
+        server_default=sa.text("'[]'::jsonb"),
+        nullable=False
+    )
+    op.create_index('ix_drafts_attach_gin', 'drafts', ['attachments'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_drafts_attach_gin', table_name='drafts', postgresql_using='gin')
+    op.alter_column(
+        'drafts', 'attachments',
+        existing_type=postgresql.JSONB(),
+        type_=sa.JSON(),
+        postgresql_using='attachments::json',
+        server_default=None,
+        nullable=True
+    )
@@ -0,0 +1,29 @@
+"""draft send_error
+
+Revision ID: d41c7f0e9a2b
+Revises: b0bdecb46512
+Create Date: 2026-10-14 07:10:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41c7f0e9a2b'
+down_revision: Union[str, Sequence[str], None] = 'b0bdecb46512'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Background sends answer 202 first, a failure is recorded on the draft for the UI
+    op.add_column('drafts', sa.Column('send_error', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('drafts', 'send_error')
@@ -0,0 +1,49 @@
+"""dashboard stats materialized views
+
+Revision ID: fa581fc16ffd
+Revises: cac0471035bd
+Create Date: 2026-10-14 05:56:05.665798
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fa581fc16ffd'
+down_revision: Union[str, Sequence[str], None] = 'cac0471035bd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Dashboard histograms, refreshed by the agent loop. The unique indexes allow REFRESH ... CONCURRENTLY
+    op.execute(
+        "CREATE MATERIALIZED VIEW mv_email_classification AS "
+        "SELECT classification, count(*) AS count FROM emails "
+        "WHERE classification IS NOT NULL GROUP BY classification"
+    )
+    op.create_index('ix_mv_email_classification', 'mv_email_classification', ['classification'], unique=True)
+
+    op.execute(
+        "CREATE MATERIALIZED VIEW mv_action_types AS "
+        "SELECT action_type, count(*) AS count FROM actions GROUP BY action_type"
+    )
+    op.create_index('ix_mv_action_types', 'mv_action_types', ['action_type'], unique=True)
+
+    op.execute(
+        "CREATE MATERIALIZED VIEW mv_top_senders AS "
+        "SELECT from_address, count(*) AS count FROM emails "
+        "GROUP BY from_address ORDER BY count(*) DESC LIMIT 100"
+    )
+    op.create_index('ix_mv_top_senders', 'mv_top_senders', ['from_address'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_top_senders")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_action_types")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_email_classification")
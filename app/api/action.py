@@ -1,32 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload, load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, text, update, select
+from typing import List, Optional
 from datetime import datetime
+import logging
 
-from app.database import get_db
+from app.database import SessionLocal, get_db, get_async_db
 from app.models.action import Action
 from app.models.email import Email
 from app.schemas.action import ActionResponse, ActionCreate, ActionApprove, GenerateReplyRequest, GenerateReplyResponse
+from app.services.gmail_client import reply_subject
 from app.services.gmail_provider import get_gmail_client
+from app.services.stats_service import invalidate_stats_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 gmail_client = get_gmail_client()
 
 @router.get("/pending", response_model=List[ActionResponse])
-def get_pending_actions(db: Session = Depends(get_db)):
+async def get_pending_actions(db: AsyncSession = Depends(get_async_db)):
     """Get all pending actions awaiting user approval"""
-    actions = (
-        db.query(Action)
-        .filter(Action.status == "pending")
+    result = await db.execute(
+        select(Action)
+        .where(Action.status == "pending")
         .order_by(Action.created_at.asc())
-        .all()
     )
-    return actions
+    return result.scalars().all()
 
 @router.get("/{action_id}", response_model=ActionResponse)
 def get_action(action_id: int, db: Session = Depends(get_db)):
     """Get a specific action by ID"""
-    action = db.query(Action).filter(Action.id == action_id).first()
+    action = db.get(Action, action_id)
     if not action:
         raise HTTPException(status_code=404, detail="Action not found")
     return action
@@ -37,69 +44,104 @@ def create_action(action: ActionCreate, db: Session = Depends(get_db)):
     db_action = Action(**action.model_dump())
     db.add(db_action)
     db.commit()
+    invalidate_stats_cache()
     db.refresh(db_action)
     return db_action
 
-@router.post("/{action_id}/approve", response_model=ActionResponse)
-def approve_action(
-    action_id: int, 
-    approval: ActionApprove, 
-    db: Session = Depends(get_db)
-):
-    """
-    Approve or reject a pending action
-
-    If approved and edited_reply provided, uses that instead of suggested_reply
-    """
-    action = db.query(Action).filter(Action.id == action_id).first()
-
-    if not action:
+def _ensure_pending(status: Optional[str]):
+    """Raise the matching HTTP error unless an action with this status can be approved/rejected"""
+    if status is None:
         raise HTTPException(status_code=404, detail="Action not found")
      # Prevent re-executing already completed actions
-    if action.status in ["executed", "approved"]:
+    if status in ["executed", "approved"]:
         raise HTTPException(
             status_code=400, 
-            detail=f"Action already {action.status}. Cannot execute again."
+            detail=f"Action already {status}. Cannot execute again."
         )
     
     # Prevent re-rejecting
-    if action.status == "rejected":#type: ignore
+    if status == "rejected":
         raise HTTPException(
             status_code=400,
             detail="Action already rejected. Cannot change status."
         )
     
     # Only pending actions can be approved
-    if action.status != "pending":#type: ignore
+    if status != "pending":
         raise HTTPException(
             status_code=400,
-            detail=f"Action has status '{action.status}'. Only pending actions can be approved."
+            detail=f"Action has status '{status}'. Only pending actions can be approved."
         )
-    
+
+@router.post("/{action_id}/approve", response_model=ActionResponse)
+def approve_action(
+    action_id: int, 
+    approval: ActionApprove, 
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Approve or reject a pending action
+
+    If approved and edited_reply provided, uses that instead of suggested_reply.
+    Approved actions are executed in the background after the response
+    """
     if not approval.approved:
-        action.status = "rejected"  # type: ignore
+        # Atomic pending -> rejected flip, no need to load the row first
+        action = db.scalars(
+            update(Action)
+            .where(Action.id == action_id, Action.status == "pending")
+            .values(status="rejected")
+            .returning(Action)
+        ).first()
+        if not action:
+            # No pending row matched: 404 if there's no such action, same 400s as approve otherwise
+            _ensure_pending(db.query(Action.status).filter(Action.id == action_id).scalar())
+            # still pending means it changed between the update and the read
+            raise HTTPException(status_code=400, detail="Action changed while being rejected, try again.")
         db.commit()
-        db.refresh(action)
+        invalidate_stats_cache()
         return action
-    
-    if approval.approved:
-        action.status = "approved"#type: ignore
-        if approval.edited_reply:
-            action.actual_reply = approval.edited_reply#type: ignore
-        email = db.query(Email).filter(Email.id == action.email_id).first()
-    
-        subject = email.subject or "" #type: ignore
-        # Remove all "Re: " prefixes (case insensitive)
-        import re
-        subject = re.sub(r'^(re:\s*)+', '', subject, 0, re.IGNORECASE).strip() #type:ignore
 
+    action = db.get(Action, action_id)
+    _ensure_pending(action.status if action else None) #type: ignore
+
+    # Accept now, the Gmail call runs after the response is sent
+    action.status = "approved"#type: ignore
+    if approval.edited_reply:
+        action.actual_reply = approval.edited_reply#type: ignore
+    db.commit()
+    invalidate_stats_cache()
+    background_tasks.add_task(_execute_approved_action, action_id, approval.edited_reply)
+    return action
+
+def _execute_approved_action(action_id: int, edited_reply: Optional[str]):
+    """
+    Run an approved action against Gmail and mark it executed
+
+    Uses its own session since the request session is closed by now. The row is
+    claimed (approved -> executing) first so execute-pending can't send it too.
+    On failure the action is marked "failed"
+    """
+    db = SessionLocal()
+    try:
+        claimed = db.execute(
+            update(Action)
+            .where(Action.id == action_id, Action.status == "approved")
+            .values(status="executing")
+            .returning(Action.id)
+        ).first()
+        db.commit()
+        if not claimed:
+            return
+        action = db.query(Action).options(joinedload(Action.email)).filter(Action.id == action_id).one()
+        email = action.email
 
-        # Add single "Re:" prefix
-        reply_subject = f"Re: {subject}"
         if action.action_type == "reply": # type: ignore
+            subject = reply_subject(email.subject) #type: ignore
             sent_message = gmail_client.send_email( 
                 to=email.from_address,  #type: ignore
-                subject=f"Re: {email.subject}", #type: ignore
+                subject=subject,
                 body=action.suggested_reply, #type: ignore
                 thread_id=email.thread_id #type: ignore
             )
@@ -109,18 +151,18 @@ def approve_action(
             if sent_email_id:
                 # ✅ Persist sent email into DB with Gmail ID
                 sent_email = Email(
-                    id=sent_email_id,  # ← Add this!
+                    id=sent_email_id,
                     thread_id=email.thread_id,#type: ignore
                     from_address=email.to_address,#type: ignore
                     to_address=email.from_address,#type: ignore
-                    subject=f"Re: {email.subject}",#type: ignore
-                    body=approval.edited_reply or action.suggested_reply,
-                    snippet=(approval.edited_reply or action.suggested_reply)[:200],
+                    subject=subject,
+                    body=edited_reply or action.suggested_reply,
+                    snippet=(edited_reply or action.suggested_reply)[:200],
                     classification="sent",
                     processed=True,
                 )
-            db.add(sent_email)
-           
+                db.add(sent_email)
+       
         elif action.action_type == "archive": # type: ignore
             # Archive the email in Gmail
             gmail_client.service.users().messages().modify(
@@ -129,74 +171,96 @@ def approve_action(
                 body={'removeLabelIds': ['INBOX']}
             ).execute()
 
-           
         email.processed = True # type: ignore
-          
-        # TODO: Actually execute the action (send email, etc.)
-        # For now, just mark as executed
         action.status = "executed"#type: ignore
         action.processed_at = datetime.now() #type: ignore
-    else:
-        action.status = "rejected" #type: ignore
-    db.commit()
-    db.refresh(action)
-    return action
+        db.commit()
+        invalidate_stats_cache()
+    except Exception:
+        db.rollback()
+        logger.exception("Error executing action %s", action_id)
+        db.query(Action).filter(Action.id == action_id, Action.status == "executing").update(
+            {"status": "failed"}, synchronize_session=False
+        )
+        db.commit()
+        invalidate_stats_cache()
+    finally:
+        db.close()
 
 @router.delete("/{action_id}")
 def delete_action(action_id: int, db: Session = Depends(get_db)):
     """Delete an action by ID"""
-    action = db.query(Action).filter(Action.id == action_id).first()
+    action = db.get(Action, action_id)
     if not action:
         raise HTTPException(status_code=404, detail="Action not found")
     db.delete(action)
     db.commit()
+    invalidate_stats_cache()
     return {"detail": "Action deleted"}
 
 @router.get("/stats/summary")
-def get_stats(db: Session = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
     """Get action statistics"""
-    total = db.query(Action).count()
-    pending = db.query(Action).filter(Action.status == "pending").count()
-    approved = db.query(Action).filter(Action.status == "approved").count()
-    executed = db.query(Action).filter(Action.status == "executed").count()
-    rejected = db.query(Action).filter(Action.status == "rejected").count()
-    
+    result = await db.execute(
+        select(Action.status, func.count(Action.id))
+        .group_by(Action.status)
+    )
+    counts = dict(result.tuples().all())
+
     return {
-        "total": total,
-        "pending": pending,
-        "approved": approved,
-        "executed": executed,
-        "rejected": rejected
+        "total": sum(counts.values()),
+        "pending": counts.get("pending", 0),
+        "approved": counts.get("approved", 0),
+        "executed": counts.get("executed", 0),
+        "rejected": counts.get("rejected", 0)
     }
 
 @router.post("/admin/fix-senders")
 def fix_senders(db: Session = Depends(get_db)):
     from email.utils import parseaddr
 
-    emails = db.query(Email).all()
+    if db.get_bind().dialect.name == "postgresql":
+        # "Name <addr>" -> addr, then normalize bare addresses, all server-side
+        extracted = db.execute(text(
+            "UPDATE emails SET from_address = lower(trim(substring(from_address from '<([^>]+)>'))) "
+            "WHERE from_address ~ '<[^>]+>'"
+        ))
+        normalized = db.execute(text(
+            "UPDATE emails SET from_address = lower(trim(from_address)) "
+            "WHERE from_address <> lower(trim(from_address))"
+        ))
+        db.commit()
+        invalidate_stats_cache()
+        return {"updated": extracted.rowcount + normalized.rowcount} # type: ignore
+
+    # Fallback for other backends: stream (id, from_address) and write back
+    # in windows so memory stays bounded on large mailboxes
+    chunk_size = 1000
+    rows = db.query(Email.id, Email.from_address).yield_per(chunk_size)
+    updates = []
     updated = 0
 
-    for e in emails:
-        _, addr = parseaddr(e.from_address or "") #type: ignore
-        if addr and e.from_address != addr:#type: ignore
-            e.from_address = addr.lower().strip()#type: ignore
-            updated += 1
+    for email_id, from_address in rows:
+        _, addr = parseaddr(from_address or "")
+        if addr and from_address != addr:
+            updates.append({"id": email_id, "from_address": addr.lower().strip()})
+        if len(updates) >= chunk_size:
+            db.bulk_update_mappings(Email, updates) # type: ignore
+            updated += len(updates)
+            updates.clear()
 
+    if updates:
+        db.bulk_update_mappings(Email, updates) # type: ignore
+        updated += len(updates)
     db.commit()
+    invalidate_stats_cache()
     return {"updated": updated}
 
-@router.post("/generate-reply", response_model=GenerateReplyResponse)
-def generate_request(
-    request: GenerateReplyRequest,
-    db: Session = Depends(get_db)
-):
-    """
-    Generate an AI reply for an email on demand
-
-    Tone options: professional, casual, friendly, brief
-    """
-
-    email = db.query(Email).filter(Email.id == request.email_id).first()
+def _reply_input(request: GenerateReplyRequest, db: Session) -> dict:
+    """Parsed email dict for generate_smart_reply, 404 if the email doesn't exist"""
+    email = db.get(Email, request.email_id, options=[load_only(
+        Email.from_address, Email.to_address, Email.subject, Email.body, Email.snippet
+    )])
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
@@ -210,10 +274,34 @@ def generate_request(
 
     if request.custom_instructions:
         parsed_email["instructions"] = request.custom_instructions
+    return parsed_email
+
+@router.post("/generate-reply", response_model=GenerateReplyResponse)
+def generate_request(
+    request: GenerateReplyRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Generate an AI reply for an email on demand
 
+    Tone options: professional, casual, friendly, brief
+    """
+    parsed_email = _reply_input(request, db)
     suggested_reply = gmail_client.generate_smart_reply(parsed_email=parsed_email)
 
     return GenerateReplyResponse(
         suggested_reply=suggested_reply,
-        email_id=email.id #type: ignore
-    )
\ No newline at end of file
+        email_id=request.email_id
+    )
+
+@router.post("/generate-reply/stream")
+def generate_request_stream(
+    request: GenerateReplyRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Same as /generate-reply, but streams the reply as plain text while it's generated
+    so the UI can show it from the first token
+    """
+    parsed_email = _reply_input(request, db)
+    return StreamingResponse(gmail_client.generate_smart_reply_stream(parsed_email), media_type="text/plain")
\ No newline at end of file
@@ -1,28 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.orm import load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.schemas.agent import AgentStats
 from app.schemas.chat import ChatRequest, ChatResponse
 from app.models import Email, Action
 from app.services.agent_service import agent
-from sqlalchemy import or_
+from sqlalchemy import func, select
+from cachetools import LRUCache
+from array import array
+import asyncio
+import functools
+import orjson
 import re
 
 from datetime import datetime, timedelta
 
 from app.services.gmail_provider import get_gmail_client
-from typing import List
+from app.services.embedding_cache import SimilarityCache, async_embed_texts
+from app.services.openai_client import async_client as client
+from typing import List, Optional
 
 router = APIRouter()
 gmail_client = get_gmail_client()
 
 @router.get("/stats", response_model=AgentStats)
-def get_status(db: Session=Depends(get_db)):
+async def get_status(db: AsyncSession=Depends(get_async_db)):
     """Get agent status"""
     running = agent.running
-    total_emails = db.query(Email).count()
-    processed_emails = db.query(Email).filter(Email.processed).count()
-    pending_actions = db.query(Action).filter(Action.status == "pending").count()
+    # one round trip: both email counters in a single pass plus the pending count as a subquery
+    result = await db.execute(select(
+        func.count(Email.id),
+        func.count(Email.id).filter(Email.processed),
+        select(func.count(Action.id)).where(Action.status == "pending").scalar_subquery()
+    ))
+    total_emails, processed_emails, pending_actions = result.one()
 
     return AgentStats(
         running=running,
@@ -32,9 +44,9 @@ def get_status(db: Session=Depends(get_db)):
     )
 
 @router.post("/chat", response_model=ChatResponse)
-def chat_with_agent(
+async def chat_with_agent(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Chat with the agent to search/manage emails using natural language
@@ -48,29 +60,103 @@ def chat_with_agent(
     message = request.message.lower()
     
     # Parse the user's intent using OpenAI
-    search_params = parse_search_intent(message)
+    search_params = await parse_search_intent(message)
     print("SEARCH PARAMS:", search_params)
     
     # Execute the search
-    emails = search_emails_with_params(db, search_params)
+    emails = await search_emails_with_params(db, search_params)
     
     # Generate a natural response
     reply = generate_reply(message, emails, search_params)
     
     return ChatResponse(
         reply=reply,
-        emails=[email_to_dict(e) for e in emails[:10]],  # Return max 10
+        emails=[email_to_dict(e) for e in emails],
     )
 
-def parse_search_intent(message: str) -> dict:
+# Near-duplicate requests reuse a previous parse when their embeddings are this similar
+SEMANTIC_CACHE_THRESHOLD = 0.92
+_semantic_cache = SimilarityCache(maxlen=128) # values are (entity tokens, params json)
+_parse_cache: LRUCache = LRUCache(maxsize=512) # normalized message -> params json
+
+# Strict structured output: the model can only return these keys, no code fences
+_SEARCH_PARAMS_FORMAT = {
+    "type": "json_schema",
+    "name": "search_params",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "sender": {"type": ["string", "null"]},
+            "classification": {"type": ["string", "null"], "enum": ["urgent", "routine", "spam", "personal", None]},
+            "time_range": {"type": ["string", "null"], "enum": ["today", "yesterday", "last_week", "last_month", None]},
+            "query": {"type": ["string", "null"]},
+            "action": {"type": "string", "enum": ["search", "archive", "delete", "mark_read"]},
+        },
+        "required": ["sender", "classification", "time_range", "query", "action"],
+        "additionalProperties": False,
+    },
+}
+
+# Wording that doesn't change the parse; everything else (names, addresses, dates,
+# labels, verbs) must match exactly before a semantic hit is trusted
+_FILLER_WORDS = frozenset("""
+a an the me my i any all some please can you show find get give list display see what which
+are is were was there do did have has email emails mail mails message messages inbox for of
+in with and that came come
+""".split())
+
+def _entity_tokens(message: str) -> frozenset:
+    return frozenset(re.findall(r"[\w+-]+(?:[.@][\w+-]+)*", message)) - _FILLER_WORDS
+
+async def parse_search_intent(message: str) -> dict:
     """
     Use OpenAI to extract search parameters from natural language
+
+    Results are cached by normalized message, with an embedding similarity
+    lookup for near-duplicate wording
     """
-    from openai import OpenAI
-    import json
-    
-    client = OpenAI()
-    
+    normalized = re.sub(r'\s+', ' ', message.strip().lower())
+    params = _parse_cache.get(normalized)
+    if params is None:
+        try:
+            params = await _parse_uncached(normalized)
+        except ValueError:
+            # Fallback: return safe defaults
+            return {
+                "sender": None,
+                "classification": None,
+                "time_range": None,
+                "query": None,
+                "action": "search",
+            }
+        _parse_cache[normalized] = params
+    return orjson.loads(params)
+
+async def _parse_uncached(message: str) -> bytes:
+    """
+    Returns the parsed params as JSON bytes so callers always get a fresh dict.
+    Raises ValueError if the LLM reply isn't valid JSON
+    """
+    signature = _entity_tokens(message)
+    same_entities = lambda value: value[0] == signature
+    if not _semantic_cache.has(same_entities):
+        # No cached parse could be reused, so embed alongside the LLM call instead of before it
+        embedding, params = await asyncio.gather(_embed(message), _ask_llm(message))
+    else:
+        embedding = await _embed(message)
+        # Similar wording isn't enough: "from john" and "from jane" embed almost the same
+        match = _semantic_cache.nearest(embedding, same_entities) if embedding else None
+        if match is not None and match[0] >= SEMANTIC_CACHE_THRESHOLD:
+            return match[1][1]
+        params = await _ask_llm(message)
+
+    if embedding:
+        _semantic_cache.add(embedding, (signature, params))
+    return params
+
+async def _ask_llm(message: str) -> bytes:
+    """One structured-output parse of message, as JSON bytes"""
     prompt = f"""
 You are an email search assistant. Parse this user request into search parameters.
 
@@ -83,79 +169,86 @@ Extract:
 - query: any keywords to search in subject/body
 - action: search, archive, delete, mark_read (if user wants to do something)
 
-Return ONLY valid JSON with these fields (use null if not mentioned):
-{{"sender": null, "classification": null, "time_range": null, "query": null, "action": "search"}}
+Use null for anything not mentioned.
 """
     
-    response = client.responses.create(
+    response = await client.responses.create(
         model="gpt-4o-mini",
-        input=prompt
+        input=prompt,
+        text={"format": _SEARCH_PARAMS_FORMAT},
     )
     
-     # ✅ Extract text from the response
-    text = response.output_text.strip()
-    if text.startswith("```"):
-        text = re.sub(r"^```(?:json)?", "", text.strip(), flags=re.IGNORECASE)
-        text = re.sub(r"```$", "", text.strip())
-        text = text.strip()
-
+    text = response.output_text
 
     # ✅ Parse JSON safely
     try:
-        parsed = json.loads(text)
-        return parsed
-    except json.JSONDecodeError:
+        params = orjson.dumps(orjson.loads(text))
+    except orjson.JSONDecodeError:
         print("⚠️ Failed to parse JSON from LLM:")
         print(text)
+        raise
+    return params
 
-        # Fallback: return safe defaults
-        return {
-            "sender": None,
-            "classification": None,
-            "time_range": None,
-            "query": None,
-            "action": "search",
-        }
+async def _embed(message: str) -> Optional[array]:
+    """Unit-length embedding of message, or None if the embeddings call fails"""
+    try:
+        return (await async_embed_texts([message]))[0]
+    except Exception as e:
+        print(f"⚠️ Embedding failed, skipping semantic cache: {e}")
+        return None
 
-def search_emails_with_params(db: Session, params: dict) -> List[Email]:
+async def search_emails_with_params(db: AsyncSession, params: dict) -> List[Email]:
     """
     Search emails based on parsed parameters
     """
-    query = db.query(Email)
+    query = select(Email)
     
     # Filter by sender
     if params.get('sender'):
-        query = query.filter(Email.from_address.ilike(f"%{params['sender']}%"))
+        query = query.where(Email.from_address.ilike(f"%{params['sender']}%"))
     
     # Filter by classification
     if params.get('classification'):
-        query = query.filter(Email.classification == params['classification'])
+        query = query.where(Email.classification == params['classification'])
     
     # Filter by time range
     if params.get('time_range'):
         now = datetime.now()
         if params['time_range'] == 'today':
             start = now.replace(hour=0, minute=0, second=0)
-            query = query.filter(Email.created_at >= start)
+            query = query.where(Email.created_at >= start)
         elif params['time_range'] == 'yesterday':
             start = (now - timedelta(days=1)).replace(hour=0, minute=0, second=0)
             end = now.replace(hour=0, minute=0, second=0)
-            query = query.filter(Email.created_at >= start, Email.created_at < end)
+            query = query.where(Email.created_at >= start, Email.created_at < end)
         elif params['time_range'] == 'last_week':
             start = now - timedelta(days=7)
-            query = query.filter(Email.created_at >= start)
+            query = query.where(Email.created_at >= start)
         elif params['time_range'] == 'last_month':
             start = now - timedelta(days=30)
-            query = query.filter(Email.created_at >= start)
+            query = query.where(Email.created_at >= start)
     
-    # Search by keywords
+    # Search by keywords (GIN-indexed full-text match on subject + body)
     if params.get('query'):
-        query = query.filter(or_(
-            Email.subject.ilike(f"%{params['query']}%"),
-            Email.body.ilike(f"%{params['query']}%")
-        ))
+        query = query.where(
+            Email.search_tsv.op('@@')(func.websearch_to_tsquery('english', params['query']))
+        )
     
-    return query.order_by(Email.created_at.desc()).limit(50).all()
+    # chat only shows 10 results, and email_to_dict only reads these columns
+    result = await db.execute(
+        query.options(load_only(
+            Email.id,
+            Email.from_address,
+            Email.subject,
+            Email.snippet,
+            Email.classification,
+            Email.created_at,
+            Email.processed
+        ))
+        .order_by(Email.created_at.desc())
+        .limit(10)
+    )
+    return list(result.scalars().all())
 
 def generate_reply(message: str, emails: List[Email], params: dict) -> str:
     """
@@ -166,14 +259,29 @@ def generate_reply(message: str, emails: List[Email], params: dict) -> str:
     if count == 0:
         return f"I couldn't find any emails matching '{message}'. Try a different search?"
     
+    # Filter values are stringified so they can key the formatter cache
+    sender, classification, time_range = (
+        str(params[key]) if params.get(key) else None
+        for key in ('sender', 'classification', 'time_range')
+    )
+    return _format_found_reply(count, sender, classification, time_range)
+
+@functools.lru_cache(maxsize=256)
+def _format_found_reply(
+    count: int,
+    sender: Optional[str],
+    classification: Optional[str],
+    time_range: Optional[str]
+) -> str:
+    """Reply text for a non-empty result, memoized since filter shapes repeat a lot"""
     # Build context about what was found
     filters_used = []
-    if params.get('sender'):
-        filters_used.append(f"from {params['sender']}")
-    if params.get('classification'):
-        filters_used.append(f"classified as {params['classification']}")
-    if params.get('time_range'):
-        filters_used.append(f"from {params['time_range']}")
+    if sender:
+        filters_used.append(f"from {sender}")
+    if classification:
+        filters_used.append(f"classified as {classification}")
+    if time_range:
+        filters_used.append(f"from {time_range}")
     
     filters_text = " ".join(filters_used) if filters_used else "matching your search"
     
@@ -187,7 +295,7 @@ def email_to_dict(email: Email) -> dict:
         "subject": email.subject,
         "snippet": email.snippet,
         "classification": email.classification,
-        "created_at": email.created_at.isoformat(),
+        "created_at": email.created_at,
         "processed": email.processed
     }
 
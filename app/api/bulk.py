@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, update
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models import Email, Action
+from app.services.gmail_client import reply_subject
 from app.services.gmail_provider import get_gmail_client
+from app.services.stats_service import invalidate_stats_cache
 from app.schemas.bulk import (
     MarkReadRequest,
     BulkDeleteRequest,
@@ -18,6 +23,19 @@ router = APIRouter()
 
 gmail_client = get_gmail_client()
 
+# messages.send can't be batched and costs 100 quota units against Gmail's
+# 250 units/sec per-user limit, so only a couple of sends run at once
+MAX_CONCURRENT_SENDS = 2
+
+def _send_reply(email: Email, body: str) -> dict:
+    """Send a reply, runs on a send worker thread (gmail_client gives each thread its own connection)"""
+    return gmail_client.send_email(
+        to=email.from_address, #type: ignore
+        subject=reply_subject(email.subject), #type: ignore
+        body=body,
+        thread_id=email.thread_id #type: ignore
+    )
+
 @router.post("/emails/mark-read")
 def mark_emails_as_read(
     request: MarkReadRequest,
@@ -34,15 +52,8 @@ def mark_emails_as_read(
     """
     if request.execute_in_gmail:
         # Actually mark as read in Gmail
-        marked = 0
-        failed = []
-
-        for email_id in request.email_ids:
-            try:
-                gmail_client.mark_as_read(email_id)
-                marked += 1
-            except Exception as e:
-                failed.append({"email_id": email_id, "error": str(e)})
+        failed = gmail_client.batch_modify(request.email_ids, {'removeLabelIds': ['UNREAD']})
+        marked = len(set(request.email_ids)) - len(failed)
         
         # Update DB
         db.query(Email).filter(Email.id.in_(request.email_ids)).update(
@@ -51,6 +62,7 @@ def mark_emails_as_read(
         )
 
         db.commit()
+        invalidate_stats_cache()
         return {
             "message": f"Marked {marked} emails as read in Gmail",
             "marked": marked,
@@ -65,6 +77,7 @@ def mark_emails_as_read(
         )
 
         db.commit()
+        invalidate_stats_cache()
         return {"message": f"Marked {updated} emails as processed in database only"}
 
 @router.post("/emails/bulk-delete")
@@ -82,23 +95,14 @@ def bulk_delete_emails(
     }
     """
     if request.delete_from_gmail:
-        deleted = 0
-        failed = []
-
-        for email_id in request.email_ids:
-            try:
-                gmail_client.service.users().messages().trash(
-                    userId='me',
-                    id=email_id
-                ).execute()
-                deleted += 1
-            except Exception as e:
-                failed.append({"email_id": email_id, "error": str(e)})
+        failed = gmail_client.batch_trash(request.email_ids)
+        deleted = len(set(request.email_ids)) - len(failed)
 
         # Remove from DB
         db.query(Action).filter(Action.email_id.in_(request.email_ids)).delete(synchronize_session=False)
         db.query(Email).filter(Email.id.in_(request.email_ids)).delete(synchronize_session=False)
         db.commit()
+        invalidate_stats_cache()
 
         return {
             "message": f"Deleted {deleted} emails from Gmail and database",
@@ -111,6 +115,7 @@ def bulk_delete_emails(
         db.query(Action).filter(Action.email_id.in_(request.email_ids)).delete(synchronize_session=False)
         deleted = db.query(Email).filter(Email.id.in_(request.email_ids)).delete(synchronize_session=False)
         db.commit()
+        invalidate_stats_cache()
         return {"message": f"Deleted {deleted} emails from database only"}
 
 @router.post("/emails/bulk-archive-sender")
@@ -127,9 +132,9 @@ def bulk_archive_sender(
             "execute_in_gmail": false
         }
     """
-    emails = db.query(Email).filter(Email.from_address == request.sender).all()
+    email_ids = [row[0] for row in db.query(Email.id).filter(Email.from_address == request.sender).all()]
 
-    if not emails:
+    if not email_ids:
         return {
             "message": f"No emails found from sender {request.sender}",
             "archived": 0
@@ -137,54 +142,45 @@ def bulk_archive_sender(
 
     if request.execute_in_gmail:
         # Execute in Gmail
-        archived = 0
+        failed = gmail_client.batch_modify(email_ids, {'removeLabelIds': ['INBOX']})
+        failed_ids = {f["email_id"] for f in failed}
+        archived_ids = [email_id for email_id in email_ids if email_id not in failed_ids]
+        status = "executed"
+    else:
+        # Update DB only
         failed = []
-        
-        for email in emails:
-            try:
-                gmail_client.archive(email.id)#type: ignore
-                archived += 1
-                # mark as processed in DB
-                email.processed = True #type: ignore
-                
-                action = Action(
-                    email_id=email.id,
-                    action_type="archive",
-                    status="executed",
-                    reason=f"Bulk archived sender {request.sender}"
-                )
-                db.add(action)
-
-            except Exception as e:
-                failed.append({"email_id": email.id, "error": str(e)})
+        archived_ids = email_ids
+        status = "pending"
 
-        db.commit()
+    # mark as processed and record the actions in two statements
+    db.query(Email).filter(Email.id.in_(archived_ids)).update(
+        {"processed": True},
+        synchronize_session=False
+    )
+    db.bulk_insert_mappings(Action, [ # type: ignore
+        {
+            "email_id": email_id,
+            "action_type": "archive",
+            "status": status,
+            "reason": f"Bulk archived sender {request.sender}"
+        }
+        for email_id in archived_ids
+    ])
+    db.commit()
+    invalidate_stats_cache()
 
+    if request.execute_in_gmail:
         return {
-            "message": f"Archived {archived} emails from {request.sender} in Gmail",
-            "archived": archived,
+            "message": f"Archived {len(archived_ids)} emails from {request.sender} in Gmail",
+            "archived": len(archived_ids),
             "failed": len(failed),
             "failures": failed
         }
     
     else:
-        # Update DB only
-        for email in emails:
-            email.processed = True #type: ignore
-
-            action = Action(
-                email_id=email.id,
-                action_type="archive",
-                status="pending",
-                reason=f"Bulk archived sender {request.sender}"
-            )
-            db.add(action)
-
-        db.commit()
-
         return {
-            "message": f"Archived {len(emails)} emails from {request.sender} in database only",
-            "archived": len(emails)
+            "message": f"Archived {len(archived_ids)} emails from {request.sender} in database only",
+            "archived": len(archived_ids)
         }
 
 @router.post("/actions/execute-pending")
@@ -200,11 +196,15 @@ def execute_pending_actions(
         "action_type": "reply"  # optional, if provided only execute this type
     }
     """
-    query = db.query(Action).filter(Action.status == "approved")
+    # Claim the rows first (approved -> executing) so an approve's background send
+    # can't run on the same action at the same time
+    claim = update(Action).where(Action.status == "approved")
     if request.action_type:
-        query = query.filter(Action.action_type == request.action_type)
-    
-    actions = query.all()
+        claim = claim.where(Action.action_type == request.action_type)
+    action_ids = db.scalars(claim.values(status="executing").returning(Action.id)).all()
+    db.commit()
+
+    actions = db.query(Action).options(selectinload(Action.email)).filter(Action.id.in_(action_ids)).all()
 
     if not actions:
         return {"message": "No pending actions to execute", "executed": 0}
@@ -212,27 +212,39 @@ def execute_pending_actions(
     executed = 0
     failed = []
 
+    # Archive everything in one Gmail batch up front
+    archive_ids = [a.email_id for a in actions if a.action_type == "archive"] # type: ignore
+    archive_failures = {}
+    if archive_ids:
+        archive_failures = {
+            f["email_id"]: f["error"]
+            for f in gmail_client.batch_modify(archive_ids, {'removeLabelIds': ['INBOX']})
+        }
+
+    # Send replies concurrently, DB updates are applied below once all sends finish
+    reply_actions = [a for a in actions if a.action_type == "reply"] # type: ignore
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SENDS) as send_pool:
+        futures = {
+            action.id: send_pool.submit(_send_reply, action.email, action.suggested_reply) # type: ignore
+            for action in reply_actions
+        }
+    send_errors = {
+        action_id: future.exception()
+        for action_id, future in futures.items()
+        if future.exception() is not None
+    }
+
     for action in actions:
         try:
-            # Here we would have logic to execute the action, e.g., send reply, archive email, etc.
-
-            email = db.query(Email).filter(Email.id == action.email_id).first()
+            email = action.email
 
             if action.action_type == "reply": # type: ignore
-                gmail_client.send_email( 
-                    to=email.from_address,  #type: ignore
-                    subject=f"Re: {email.subject}", #type: ignore
-                    body=action.suggested_reply, #type: ignore
-                    thread_id=email.thread_id #type: ignore
-                )
+                if action.id in send_errors:
+                    raise send_errors[action.id]
                 action.actual_reply = action.suggested_reply # type: ignore
             elif action.action_type == "archive": # type: ignore
-                # Archive the email in Gmail
-                gmail_client.service.users().messages().modify(
-                    userId='me',
-                    id=email.id,  # type: ignore
-                    body={'removeLabelIds': ['INBOX']}
-                ).execute()
+                if action.email_id in archive_failures:
+                    raise Exception(archive_failures[action.email_id])
 
             action.status = "executed" # type: ignore
             email.processed = True # type: ignore
@@ -247,6 +259,7 @@ def execute_pending_actions(
             action.status = "failed" # type: ignore
 
     db.commit()
+    invalidate_stats_cache()
 
     return {
         "message": f"Executed {executed} pending actions",
@@ -256,22 +269,20 @@ def execute_pending_actions(
     }
 
 @router.get("/stats/by-sender")
-def get_stats_by_sender(db: Session = Depends(get_db)):
+async def get_stats_by_sender(db: AsyncSession = Depends(get_async_db)):
     """
     Get email statistics grouped by sender.
     """
-    from sqlalchemy import func
-
-    results = (
-        db.query(
+    result = await db.execute(
+        select(
             Email.from_address,
             func.count(Email.id).label("count"),
             Email.classification
         ).group_by(Email.from_address, Email.classification)
         .order_by(func.count(Email.id).desc())
         .limit(20)
-        .all()
     )
+    results = result.all()
 
     return [
         {
@@ -296,31 +307,20 @@ def bulk_delete_sender(
             "delete_from_gmail": false
         }
      """
-    emails = db.query(Email).filter(Email.from_address==request.sender).all()
+    email_ids = [row[0] for row in db.query(Email.id).filter(Email.from_address==request.sender).all()]
 
-    if not emails:
+    if not email_ids:
         return {"message": "No emails found from this sender", "count": 0}
-    
-    email_ids = [e.id for e in emails]
 
     if request.delete_from_gmail:
-        deleted = 0
-        failed = []
-
-        for email_id in email_ids:
-            try:
-                gmail_client.service.users().messages().trash(
-                    userId='me',
-                    id=email_id
-                ).execute()
-                deleted += 1
-            except Exception as e:
-                failed.append({"email_id": email_id, "error": str(e)})
+        failed = gmail_client.batch_trash(email_ids)
+        deleted = len(email_ids) - len(failed)
         
         # Delete from database
         db.query(Action).filter(Action.email_id.in_(email_ids)).delete(synchronize_session=False)
         db_deleted = db.query(Email).filter(Email.id.in_(email_ids)).delete(synchronize_session=False)
         db.commit()
+        invalidate_stats_cache()
     
         return {
             "message": f"Deleted {deleted} emails from {request.sender} in Gmail",
@@ -335,6 +335,7 @@ def bulk_delete_sender(
         db.query(Action).filter(Action.email_id.in_(email_ids)).delete(synchronize_session=False)
         deleted = db.query(Email).filter(Email.id.in_(email_ids)).delete(synchronize_session=False)
         db.commit()
+        invalidate_stats_cache()
         
         return {
             "message": f"Deleted {deleted} emails from {request.sender} in database only",
@@ -2,26 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.models import AgentConfig
 from app.schemas.config import AgentConfigResponse, AgentConfigUpdate, AddEmails
+from app.services.config_service import get_cached_config, get_or_create_config, invalidate_config_cache
 
 
 router = APIRouter()
 
-def get_or_create_config(db: Session) -> AgentConfig:
-    """Get config or create config if it doesn't exist"""
-    config = db.query(AgentConfig).filter(AgentConfig.id == 1).first()
-    if not config:
-        config = AgentConfig()
-        db.add(config)
-        db.commit()
-        db.refresh(config)
-    return config
-
 @router.get("/", response_model=AgentConfigResponse)
 def get_config(db: Session = Depends(get_db)):
     """Get the agent configuration"""
-    config = get_or_create_config(db)
+    config = get_cached_config(db)
 
     response = AgentConfigResponse(
         id=config.id, # type: ignore
@@ -50,12 +40,12 @@ def update_config(
         setattr(config, key, value)
     
     db.commit()
-    db.refresh(config)
+    invalidate_config_cache()
 
     return {
         "message": "Configuration updated successfully.",
-        "whitelist": config.get_whitelist(),
-        "blacklist": config.get_blacklist()
+        "whitelist": list(config.get_whitelist()),
+        "blacklist": list(config.get_blacklist())
         }
 
 @router.post("/whitelist/add")
@@ -63,18 +53,20 @@ def add_to_whitelist(data: AddEmails, db: Session = Depends(get_db)):
     """Add an email/domain to the auto-reply whitelist"""
     config = get_or_create_config(db)
 
-    whitelist = config.get_whitelist()
+    whitelist = list(config.get_whitelist())
+    existing = set(whitelist)
     added = []
     
     for email in data.emails:
         email_clean = email.strip().lower()
-        if email_clean not in whitelist:
+        if email_clean not in existing:
+            existing.add(email_clean)
             whitelist.append(email_clean)
             added.append(email_clean)
 
     config.auto_reply_whitelist = ",".join(whitelist) # type: ignore
     db.commit()
-    db.refresh(config)
+    invalidate_config_cache()
     return {
         "message": f"Added {len(added)} email(s) to whitelist",
         "added": added,
@@ -86,18 +78,20 @@ def add_to_blacklist(data: AddEmails, db: Session = Depends(get_db)):
     """Add an email/domain to the auto-reply blacklist"""
     config = get_or_create_config(db)
 
-    blacklist = config.get_blacklist()
+    blacklist = list(config.get_blacklist())
+    existing = set(blacklist)
     added = []
     
     for email in data.emails:
         email_clean = email.strip().lower()
-        if email_clean not in blacklist:
+        if email_clean not in existing:
+            existing.add(email_clean)
             blacklist.append(email_clean)
             added.append(email_clean)
 
     config.auto_reply_blacklist = ",".join(blacklist) # type: ignore
     db.commit()
-    db.refresh(config)
+    invalidate_config_cache()
     return {
         "message": f"Added {len(added)} email(s) to blacklist",
         "added": added,
@@ -109,13 +103,13 @@ def remove_from_whitelist(email: str, db: Session = Depends(get_db)):
     """Remove email/domain from whitelist"""
     config = get_or_create_config(db)
 
-    whitelist = config.get_whitelist()
+    whitelist = list(config.get_whitelist())
     email = email.strip().lower()
     if email in whitelist:
         whitelist.remove(email)
         config.auto_reply_whitelist = ",".join(whitelist) # type: ignore
         db.commit()
-        db.refresh(config)
+        invalidate_config_cache()
     return {"message": f"{email} removed from whitelist.", "whitelist": whitelist}
 
 @router.delete("/blacklist/{email}")
@@ -123,11 +117,11 @@ def remove_from_blacklist(email: str, db: Session = Depends(get_db)):
     """Remove email/domain from blacklist"""
     config = get_or_create_config(db)
 
-    blacklist = config.get_blacklist()
+    blacklist = list(config.get_blacklist())
     email = email.strip().lower()
     if email in blacklist:
         blacklist.remove(email)
         config.auto_reply_blacklist = ",".join(blacklist) # type: ignore
         db.commit()
-        db.refresh(config)
+        invalidate_config_cache()
     return {"message": f"{email} removed from blacklist.", "blacklist": blacklist}
\ No newline at end of file
@@ -1,21 +1,52 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, text, select
+from typing import Optional
 from app.database import get_db
 from app.schemas.dashboard import DashboardStats, Totals, RecentActivity, TopSender
 from app.models import Email, Action
-from app.services.agent_service import agent
+from app.services.stats_service import cached_stats, mv_action_types, mv_email_classification, mv_top_senders
 from datetime import datetime, timedelta
 
 router = APIRouter()
 
+# Above this many rows the email total comes from the planner estimate instead of COUNT(*)
+EXACT_COUNT_THRESHOLD = 100_000
+
 @router.get("/stats", response_model=DashboardStats)
 def get_stats(db: Session=Depends(get_db)):
     """Stats for dashboard"""
-    total_emails = db.query(Email).count()
-    processed_emails = db.query(Email).filter(Email.processed).count()
-    pending_actions = db.query(Action).filter(Action.status == "pending").count()
-    unprocessed = total_emails - processed_emails
+    user_id = 1 # single user for now
+    return cached_stats(user_id, lambda: _compute_stats(db))
+
+def fast_estimate(db: Session, table: str) -> Optional[int]:
+    """Postgres planner row estimate for a table, O(1). None on other databases or before the first ANALYZE"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": table}
+    ).scalar()
+    return estimate if estimate and estimate > 0 else None
+
+def _compute_stats(db: Session) -> DashboardStats:
+    seven_days_ago = datetime.utcnow() - timedelta(days=7)
+    estimate = fast_estimate(db, Email.__tablename__)
+    if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+        # Big table: approximate total, exact unprocessed count off ix_emails_processed_created
+        unprocessed = db.query(func.count(Email.id)).filter(Email.processed == False).scalar()
+        total_emails = max(estimate, unprocessed)
+        processed_emails = total_emails - unprocessed
+        last_7_days = db.query(func.count(Email.id)).filter(Email.created_at >= seven_days_ago).scalar()
+    else:
+        # One pass over emails for all the counters
+        total_emails, processed_emails, last_7_days = db.query(
+            func.count(Email.id),
+            func.count(Email.id).filter(Email.processed == True),
+            func.count(Email.id).filter(Email.created_at >= seven_days_ago),
+        ).one()
+        unprocessed = total_emails - processed_emails
+    pending_actions = db.query(func.count(Action.id)).filter(Action.status == "pending").scalar()
 
     totals = Totals(
         emails=total_emails,
@@ -24,48 +55,60 @@ def get_stats(db: Session=Depends(get_db)):
         unprocessed=unprocessed
     )
 
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    last_7_days = db.query(Email).filter(Email.created_at >= seven_days_ago).count()
-
     recent_activity = RecentActivity(
         last_7_days=last_7_days
     )
 
-    classification_rows = (
-        db.query(
-            Email.classification,
-            func.count(Email.id)
+    if db.get_bind().dialect.name == "postgresql":
+        # Precomputed by the stats refresher, tiny reads instead of full scans
+        classification_rows = db.execute(
+            select(mv_email_classification.c.classification, mv_email_classification.c.count)
+        ).all()
+        action_types_rows = db.execute(
+            select(mv_action_types.c.action_type, mv_action_types.c.count)
+        ).all()
+        top_sender_rows = db.execute(
+            select(mv_top_senders.c.from_address, mv_top_senders.c.count)
+            .order_by(mv_top_senders.c.count.desc())
+            .limit(5)
+        ).all()
+    else:
+        classification_rows = (
+            db.query(
+                Email.classification,
+                func.count(Email.id)
+            )
+            .filter(Email.classification.isnot(None))
+            .group_by(Email.classification)
+            .all()
         )
-        .filter(Email.classification.isnot(None))
-        .group_by(Email.classification)
-        .all()
-    )
+
+        action_types_rows = (
+            db.query(
+                Action.action_type,
+                func.count(Action.id)
+            )
+            .group_by(Action.action_type)
+            .all()
+        )
+
+        top_sender_rows = (
+            db.query(
+                Email.from_address,
+                func.count(Email.id).label("count")
+            ).group_by(Email.from_address)
+            .order_by(func.count(Email.id).desc())
+            .limit(5)
+            .all()
+        )
+
     classification = {
         classification: count for classification, count in classification_rows
     }
-
-    action_types_rows = (
-        db.query(
-            Action.action_type,
-            func.count(Action.id)
-        )
-        .group_by(Action.action_type)
-        .all()
-    )
     action_types = {
         action_type: count for action_type, count in action_types_rows
     }
 
-    top_sender_rows = (
-        db.query(
-            Email.from_address,
-            func.count(Email.id).label("count")
-        ).group_by(Email.from_address)
-        .order_by(func.count(Email.id).desc())
-        .limit(5)
-        .all()
-    )
-
     top_senders = [
         TopSender(
             email=email,
@@ -1,5 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import cast, func, select, update
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH
 from typing import List
 from app.schemas.draft import DraftCreate, DraftUpdate, DraftResponse
 
@@ -9,11 +12,12 @@ from app.services.storage import storage_service
 
 router = APIRouter()
 
-@router.get("/", response_model=List[DraftResponse])
+@router.get("/", response_model=None, responses={200: {"model": List[DraftResponse]}})
 def list_drafts(db: Session = Depends(get_db)):
     """Get all drafts"""
-    drafts = db.query(Draft).order_by(Draft.updated_at.desc()).all()
-    return drafts
+    # Plain rows straight to JSON, the table's columns are exactly DraftResponse's fields
+    rows = db.execute(select(Draft.__table__).order_by(Draft.updated_at.desc())).mappings()
+    return ORJSONResponse([dict(row) for row in rows])
 
 @router.post("/", response_model=DraftResponse)
 def create_draft(draft: DraftCreate, db: Session = Depends(get_db)):
@@ -32,7 +36,7 @@ def create_draft(draft: DraftCreate, db: Session = Depends(get_db)):
 @router.get("/{draft_id}", response_model=DraftResponse)
 def get_draft(draft_id: int, db: Session = Depends(get_db)):
     """Get a specific draft"""
-    draft = db.query(Draft).filter(Draft.id == draft_id).filter().first()
+    draft = db.get(Draft, draft_id)
     if not draft:
         raise HTTPException(status_code=404, detail="Draft not found")
     return draft
@@ -44,7 +48,7 @@ def update_draft(
     db: Session = Depends(get_db)
 ):
     """Update a draft (auto-save)"""
-    draft = db.query(Draft).filter(Draft.id == draft_id).first()
+    draft = db.get(Draft, draft_id)
     if not draft:
         raise HTTPException(status_code=404, detail="Draft not found")
 
@@ -62,18 +66,23 @@ async def upload_attachment(
     db: Session = Depends(get_db)
 ):
     """Upload a temporary draft attachment"""
-    draft = db.query(Draft).filter(Draft.id == draft_id).first()
-    if not draft:
+    if not db.query(Draft.id).filter(Draft.id == draft_id).scalar():
         raise HTTPException(status_code=404, detail="Draft not found")
     
     file_info = await storage_service.save_draft_attachment(draft_id=draft_id, file=file)
 
-    attachments = draft.attachments or [] 
-    attachments.append(file_info)
-    draft.attachments = attachments #type: ignore
+    if db.get_bind().dialect.name == "postgresql":
+        # Append server-side, concurrent uploads can't overwrite each other
+        db.execute(
+            update(Draft)
+            .where(Draft.id == draft_id)
+            .values(attachments=Draft.attachments.op("||")(cast([file_info], JSONB)))
+        )
+    else:
+        draft = db.get(Draft, draft_id)
+        draft.attachments = [*draft.attachments, file_info] #type: ignore
 
     db.commit()
-    db.refresh(draft)
 
     return file_info
 
@@ -84,12 +93,27 @@ def remove_draft_attachment(
     db: Session = Depends(get_db)
 ):
     """Remove attachment from draft"""
-    draft = db.query(Draft).filter(Draft.id == draft_id).first()
-    if not draft:
-        raise HTTPException(status_code=404, detail="Draft not found")
-    
-    attachments = [a for a in (draft.attachments or []) if a["filename"] != filename]#type: ignore
-    draft.attachments = attachments #type: ignore
+    if db.get_bind().dialect.name == "postgresql":
+        # Filter the array server-side instead of loading it
+        draft_id = db.execute(
+            update(Draft)
+            .where(Draft.id == draft_id)
+            .values(attachments=func.jsonb_path_query_array(
+                Draft.attachments,
+                cast("$[*] ? (@.filename != $fn)", JSONPATH),
+                func.jsonb_build_object("fn", filename)
+            ))
+            .returning(Draft.id)
+        ).scalar()
+        if not draft_id:
+            raise HTTPException(status_code=404, detail="Draft not found")
+    else:
+        draft = db.get(Draft, draft_id)
+        if not draft:
+            raise HTTPException(status_code=404, detail="Draft not found")
+        
+        attachments = [a for a in draft.attachments if a["filename"] != filename]#type: ignore
+        draft.attachments = attachments #type: ignore
     
     db.commit()
 
@@ -100,7 +124,7 @@ def remove_draft_attachment(
 @router.delete("/{draft_id}")
 def delete_draft(draft_id: int, db: Session = Depends(get_db)):
     """Delete a draft"""
-    draft = db.query(Draft).filter(Draft.id == draft_id).first()
+    draft = db.get(Draft, draft_id)
     if not draft:
         raise HTTPException(status_code=404, detail="Draft not found")
 
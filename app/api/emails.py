@@ -1,22 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, and_
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy import or_, func, case, exists, select, update
 from typing import List, Optional
+import logging
 
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.models.email import Email
 from app.models.draft import Draft
-from app.schemas.email import EmailResponse, EmailCreate, SendReplyRequest, ComposeEmailRequest, AttachmentInfo
+from app.schemas.email import EmailResponse, EmailSummary, EmailThreadResponse, EmailCreate, SendReplyRequest, ComposeEmailRequest, AttachmentInfo
+from app.services.gmail_client import reply_subject
 from app.services.gmail_provider import get_gmail_client
 from app.services.storage import storage_service
-import re
+from app.services.stats_service import invalidate_stats_cache
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
+
 def get_client():
     return get_gmail_client()
 
-@router.get("/", response_model=List[EmailResponse])
+def _summary_columns(source) -> list:
+    """Columns EmailSummary needs, from the Email model or a subquery's .c"""
+    return [
+        source.id, source.thread_id, source.subject, source.from_address, source.to_address,
+        source.snippet, source.classification, source.processed, source.created_at, source.updated_at,
+    ]
+
+def _rows_response(db: Session, stmt) -> ORJSONResponse:
+    """
+    Serialize plain result rows straight to JSON, skipping per-row Pydantic validation.
+    Only for selects of trusted columns shaped exactly like the route's documented model,
+    the route declares that model under responses= instead of response_model
+    """
+    return ORJSONResponse([dict(row) for row in db.execute(stmt).mappings()])
+
+@router.get("/", response_model=None, responses={200: {"model": List[EmailSummary]}})
 def list_emails(
     skip: int = 0, 
     limit: int = 100, 
@@ -32,20 +52,20 @@ def list_emails(
     - **classification**: Filter by email classification(urgent, spam, routine, personal)
     - **processed**: Filter by whether the email has been processed
     """
-    query = db.query(Email)
+    # Plain rows of just the summary columns, no ORM objects or body
+    stmt = select(*_summary_columns(Email))
 
     if classification:
-        query = query.filter(Email.classification == classification)
+        stmt = stmt.where(Email.classification == classification)
     
     if processed is not None:
-        query = query.filter(Email.processed == processed)
+        stmt = stmt.where(Email.processed == processed)
 
-    query = query.order_by(Email.created_at.desc())
-    emails = query.offset(skip).limit(limit).all()
+    stmt = stmt.order_by(Email.created_at.desc()).offset(skip).limit(limit)
 
-    return emails
+    return _rows_response(db, stmt)
 
-@router.get("/threads")
+@router.get("/threads", response_model=None, responses={200: {"model": List[EmailThreadResponse]}})
 def list_threads(
     classification: Optional[str] = None,
     processed: Optional[bool] = None,
@@ -57,72 +77,45 @@ def list_threads(
     Returns one email per thread with thread count
     """
 
-    # Subquery to get the latest email per thread
-    latest_email_subq = (
-        db.query(
-            Email.thread_id,
-            func.max(Email.created_at).label('latest_created_at')
+    # Rank each thread's emails newest first and count the thread in the same pass
+    thread_window = {"partition_by": Email.thread_id}
+    ranked = (
+        select(
+            *_summary_columns(Email),
+            func.row_number().over(**thread_window, order_by=Email.created_at.desc()).label('rn'),
+            func.count(Email.id).over(**thread_window).label('thread_count'),
+            func.sum(case((Email.processed == False, 1), else_=0)).over(**thread_window).label('unread_count')
         )
-        .group_by(Email.thread_id)
         .subquery()
     )
     
-    # Get full email details for latest in each thread
-    query = (
-        db.query(Email)
-        .join(
-            latest_email_subq,
-            and_(
-                Email.thread_id == latest_email_subq.c.thread_id,
-                Email.created_at == latest_email_subq.c.latest_created_at
-            )
+    # Keep only the latest email in each thread
+    stmt = (
+        select(
+            *_summary_columns(ranked.c),
+            ranked.c.thread_count,
+            (ranked.c.unread_count > 0).label('has_unread')
         )
+        .where(ranked.c.rn == 1)
     )
     # Apply filters
     if classification:
-        query = query.filter(Email.classification == classification)
+        stmt = stmt.where(ranked.c.classification == classification)
     
     if processed is not None:
-        query = query.filter(Email.processed == processed)
+        stmt = stmt.where(ranked.c.processed == processed)
     
     # Get threads ordered by most recent
-    threads = query.order_by(Email.created_at.desc()).limit(limit).all()
-    
-    # Build response with thread counts
-    result = []
-    for email in threads:
-        # Count emails in this thread
-        thread_count = db.query(Email).filter(Email.thread_id == email.thread_id).count()
-        
-        # Check if thread has any unread
-        has_unread = db.query(Email).filter(
-            Email.thread_id == email.thread_id,
-            Email.processed == False
-        ).count() > 0
-        
-        result.append({
-            "id": email.id,
-            "thread_id": email.thread_id,
-            "from_address": email.from_address,
-            "to_address": email.to_address,
-            "subject": email.subject,
-            "snippet": email.snippet,
-            "body": email.body,
-            "classification": email.classification,
-            "processed": email.processed,
-            "created_at": email.created_at.isoformat(),
-            "thread_count": thread_count,
-            "has_unread": has_unread
-        })
-    return result
-
-@router.get("/threads/{thread_id}")
+    return _rows_response(db, stmt.order_by(ranked.c.created_at.desc()).limit(limit))
+
+@router.get("/threads/{thread_id}", response_model=List[EmailResponse])
 def get_thread_emails(thread_id: str, db: Session = Depends(get_db), gmail_client=Depends(get_client)):
     """
     Get all emails in a specific thread, ordered chronologically
     """
     emails = (
         db.query(Email)
+        .options(undefer(Email.body))
         .filter(Email.thread_id == thread_id)
         .order_by(Email.created_at.asc())
         .all()
@@ -131,32 +124,21 @@ def get_thread_emails(thread_id: str, db: Session = Depends(get_db), gmail_clien
     if not emails:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    for email in emails:
-        print(f"Email: {email}")
-        email.processed = True #type:ignore
+    # One UPDATE for the whole thread, the loaded rows are synced in memory
+    db.execute(
+        update(Email)
+        .where(Email.thread_id == thread_id, Email.processed.is_(False))
+        .values(processed=True)
+    )
     db.commit()
     try:
         gmail_client.mark_as_read(emails[-1].id)
     except Exception:
         pass
 
-    return [
-        {
-            "id": email.id,
-            "thread_id": email.thread_id,
-            "from_address": email.from_address,
-            "to_address": email.to_address,
-            "subject": email.subject,
-            "snippet": email.snippet,
-            "body": email.body,
-            "classification": email.classification,
-            "processed": email.processed,
-            "created_at": email.created_at.isoformat(),
-        }
-        for email in emails
-    ]
+    return emails
 
-@router.get("/search/threads", response_model=List[EmailResponse])
+@router.get("/search/threads", response_model=None, responses={200: {"model": List[EmailThreadResponse]}})
 def search_threads(
     query: str="",
     sender: Optional[str]=None,
@@ -174,79 +156,62 @@ def search_threads(
     - **processed** Filter by processing status
     """
 
-    q = db.query(Email)
+    # Filters apply to the emails table directly, so the trigram indexes can serve them
+    q = select(
+        *_summary_columns(Email),
+        func.row_number().over(partition_by=Email.thread_id, order_by=Email.created_at.desc()).label('rn')
+    )
 
     if query:
         filter_clause = or_(
             Email.subject.ilike(f'%{query}%'),
             Email.body.ilike(f'%{query}%')
         )
-        q = q.filter(filter_clause)
+        q = q.where(filter_clause)
 
     if sender:
-        q = q.filter(Email.from_address.ilike(f"%{sender}%"))
+        q = q.where(Email.from_address.ilike(f"%{sender}%"))
     
     if classification:
-        q = q.filter(Email.classification == classification)
+        q = q.where(Email.classification == classification)
     
     if processed is not None:
-        q = q.filter(Email.processed == processed)
-
+        q = q.where(Email.processed == processed)
+
+    # Latest matching email per thread, for the newest `limit` threads
+    ranked = q.subquery()
+    latest = (
+        select(*_summary_columns(ranked.c))
+        .where(ranked.c.rn == 1)
+        .order_by(ranked.c.created_at.desc())
+        .limit(limit)
+        .subquery()
+    )
 
-    # Subquery to get the latest email per thread
-    latest_per_thread_subq = (
-        
-        q.with_entities(
-        Email.thread_id,
-        func.max(Email.created_at).label('latest_created_at')
+    # Counts cover the whole thread, not just the matching emails, only for the threads returned
+    counts = (
+        select(
+            Email.thread_id,
+            func.count(Email.id).label('thread_count'),
+            func.sum(case((Email.processed == False, 1), else_=0)).label('unread_count')
         )
+        .where(Email.thread_id.in_(select(latest.c.thread_id)))
         .group_by(Email.thread_id)
         .subquery()
     )
-    threads_q = (
-        db.query(Email)
-        .join(
-            latest_per_thread_subq,
-            and_(
-                Email.thread_id == latest_per_thread_subq.c.thread_id,
-                Email.created_at == latest_per_thread_subq.c.latest_created_at,
-            ),
+    threads_stmt = (
+        select(
+            *_summary_columns(latest.c),
+            counts.c.thread_count,
+            (counts.c.unread_count > 0).label('has_unread')
         )
-        .order_by(Email.created_at.desc())
-        .limit(limit)
+        .join(counts, counts.c.thread_id == latest.c.thread_id)
+        .order_by(latest.c.created_at.desc())
     )
-    threads = threads_q.all()
-    # Get full email details for latest in each thread
-     # Build response with thread counts
-    result = []
-    for email in threads:
-        # Count emails in this thread
-        thread_count = db.query(Email).filter(Email.thread_id == email.thread_id).count()
-        
-        # Check if thread has any unread
-        has_unread = db.query(Email).filter(
-            Email.thread_id == email.thread_id,
-            Email.processed == False
-        ).count() > 0
-        
-        result.append({
-            "id": email.id,
-            "thread_id": email.thread_id,
-            "from_address": email.from_address,
-            "to_address": email.to_address,
-            "subject": email.subject,
-            "snippet": email.snippet,
-            "body": email.body,
-            "classification": email.classification,
-            "processed": email.processed,
-            "created_at": email.created_at.isoformat(),
-            "thread_count": thread_count,
-            "has_unread": has_unread
-        })
-    return result
+    return _rows_response(db, threads_stmt)
     
 
-@router.get("/search", response_model=List[EmailResponse])
+@router.get("/search", response_model=None, responses={200: {"model": List[EmailSummary]}})
 def search_emails(
     query: str="",
     sender: Optional[str]=None,
@@ -264,32 +229,31 @@ def search_emails(
     - **processed** Filter by processing status
     """
 
-    q = db.query(Email)
+    q = select(*_summary_columns(Email))
 
     if query:
         filter_clause = or_(
             Email.subject.ilike(f'%{query}%'),
             Email.body.ilike(f'%{query}%')
         )
-        q = q.filter(filter_clause)
+        q = q.where(filter_clause)
 
     if sender:
-        q = q.filter(Email.from_address.ilike(f"%{sender}%"))
+        q = q.where(Email.from_address.ilike(f"%{sender}%"))
     
     if classification:
-        q = q.filter(Email.classification == classification)
+        q = q.where(Email.classification == classification)
     
     if processed is not None:
-        q = q.filter(Email.processed == processed)
+        q = q.where(Email.processed == processed)
     
     # Order by newest first
-    emails = q.order_by(Email.created_at.desc()).limit(limit).all()
-    return emails
+    return _rows_response(db, q.order_by(Email.created_at.desc()).limit(limit))
 
 @router.get("/{email_id}", response_model=EmailResponse)
 def get_email(email_id: str, db: Session = Depends(get_db)):
     """Get a specific email by ID"""
-    email = db.query(Email).filter(Email.id == email_id).first()
+    email = db.get(Email, email_id, options=[undefer(Email.body)])
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     return email
@@ -300,100 +264,151 @@ def create_email(email: EmailCreate, db: Session = Depends(get_db)):
     db_email = Email(**email.model_dump())
     db.add(db_email)
     db.commit()
-    db.refresh(db_email)
+    # only the server-generated timestamp, a full refresh would expire the deferred body
+    db.refresh(db_email, ["created_at"])
+    invalidate_stats_cache()
     return db_email
 
 @router.get("/unprocessed/count")
 def count_unprocessed(db: Session = Depends(get_db)):
     """Count unprocessed emails"""
-    count = db.query(Email).filter(Email.processed == False).count()
+    count = db.query(func.count(Email.id)).filter(Email.processed == False).scalar()
     return {"count": count}
 
-@router.post("/send-new")
+@router.post("/send-new", status_code=202)
 def send_new(
     request: ComposeEmailRequest,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
     gmail_client=Depends(get_client)
 ):
-    
+    """Queue a new email, the Gmail send runs after the response"""
+    background_tasks.add_task(_do_send_new, request, gmail_client)
+    return {"message": "Email queued", "status": "queued"}
+
+def _do_send_new(request: ComposeEmailRequest, gmail_client):
+    """Send a composed email, then record it as sent and drop its draft"""
     attachment_data = [
         (att.filepath, att.original_filename)
         for att in request.attachments
     ]
-    sent_message = gmail_client.send_email_with_attachments(
-        to=request.to_address,
-        subject=request.subject,
-        body=request.body,
-        attachment_data=attachment_data,
-    )
-
-    if request.draft_id:
-        storage_service.delete_draft_files(draft_id=request.draft_id)
-
-        draft = db.query(Draft).filter(Draft.id == request.draft_id).first()
-        if draft:
-            db.delete(draft)
-            db.commit()
-    # Save sent email to database
-    sent_email_id = sent_message.get('id') if sent_message else None
-
-    if sent_email_id:
-        from_address = gmail_client.from_address
-        
-        sent_email = Email(
-            id=sent_email_id,
-            thread_id=sent_message.get('threadId'),
-            from_address=from_address,
-            to_address=request.to_address,
+    db = SessionLocal()
+    sent = False
+    try:
+        sent_message = gmail_client.send_email_with_attachments(
+            to=request.to_address,
             subject=request.subject,
             body=request.body,
-            snippet=request.body[:200],
-            classification="sent",
-            processed=True,
+            attachment_data=attachment_data,
         )
-        db.add(sent_email)
+        sent = True
+
+        # Save sent email to database
+        sent_email_id = sent_message.get('id') if sent_message else None
+
+        if sent_email_id:
+            from_address = gmail_client.from_address
+            
+            sent_email = Email(
+                id=sent_email_id,
+                thread_id=sent_message.get('threadId'),
+                from_address=from_address,
+                to_address=request.to_address,
+                subject=request.subject,
+                body=request.body,
+                snippet=request.body[:200],
+                classification="sent",
+                processed=True,
+            )
+            db.add(sent_email)
+
+        # the draft goes in the same commit, it's only dropped once the send is recorded
+        draft = db.get(Draft, request.draft_id) if request.draft_id else None
+        if draft:
+            db.delete(draft)
         db.commit()
-    return {"message": "Email sent successfully", "email_id": sent_email_id}
+        invalidate_stats_cache()
+        if request.draft_id:
+            storage_service.delete_draft_files(draft_id=request.draft_id)
+    except Exception as e:
+        db.rollback()
+        logger.exception("Error sending email to %s", request.to_address)
+        _record_send_failure(request.draft_id, request.to_address, request.subject, request.body, sent, e)
+    finally:
+        db.close()
+
+def _record_send_failure(draft_id: Optional[int], to: str, subject: str, body: str, sent: bool, error: Exception):
+    """
+    Flag the draft (a new one if the send had none) with the error, the client already
+    got a 202 so this is the only place the UI can find out
+    """
+    db = SessionLocal()
+    try:
+        draft = db.get(Draft, draft_id) if draft_id else None
+        if draft is None:
+            draft = Draft(to=to, subject=subject, body=body, attachments=[])
+            db.add(draft)
+        # a send that went out must not be retried, only its bookkeeping failed
+        draft.send_error = f"Sent, but saving it failed: {error}" if sent else f"Send failed: {error}" # type: ignore
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Could not record the failed send to %s", to)
+    finally:
+        db.close()
 
-@router.post("/send-reply")
+@router.post("/send-reply", status_code=202)
 def send_reply(
     request: SendReplyRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     gmail_client=Depends(get_client)
 ):
-    """Send a reply to an email"""
-    email = db.query(Email).filter(Email.id == request.email_id).first()
-    if not email:
+    """Queue a reply to an email, the Gmail send runs after the response"""
+    if not db.query(exists().where(Email.id == request.email_id)).scalar():
         raise HTTPException(status_code=404, detail="Email not found")
-    subject = email.subject or ""
-    # Remove all "Re: " prefixes (case insensitive)
-    subject = re.sub(r'^(re:\s*)+', '', subject, flags=re.IGNORECASE).strip() #type:ignore
-    # Add single "Re:" prefix
-    reply_subject = f"Re: {subject}"
-    # Send the email
-    sent_message = gmail_client.send_email(
-        to=email.from_address,#type: ignore
-        subject=f"Re: {reply_subject}",
-        body=request.reply_text,
-        thread_id=email.thread_id #type: ignore
-    )
+    background_tasks.add_task(_do_send_reply, request, gmail_client)
+    return {"message": "reply queued", "status": "queued"}
 
-    # Save sent email to database
-    sent_email_id = sent_message.get('id') if sent_message else None
-    if sent_email_id:
-        sent_email = Email(
-            id=sent_email_id,
-            thread_id=email.thread_id,
-            from_address=email.to_address,
-            to_address=email.from_address,
-            subject=f"Re: {email.subject}",
+def _do_send_reply(request: SendReplyRequest, gmail_client):
+    """Send a reply, record it as sent and mark the original processed"""
+    db = SessionLocal()
+    to, subject, sent = None, None, False
+    try:
+        email = db.get(Email, request.email_id)
+        if not email:
+            return
+        to, subject = email.from_address, reply_subject(email.subject) #type: ignore
+        # Send the email
+        sent_message = gmail_client.send_email(
+            to=to,
+            subject=subject,
             body=request.reply_text,
-            snippet=request.reply_text[:200],
-            classification="sent",
-            processed=True,
+            thread_id=email.thread_id #type: ignore
         )
-        db.add(sent_email)
-    email.processed = True #type: ignore
-    db.commit()
-
-    return {"message": "reply sent successfully", "email_id": sent_email_id}
+        sent = True
+
+        # Save sent email to database
+        sent_email_id = sent_message.get('id') if sent_message else None
+        if sent_email_id:
+            sent_email = Email(
+                id=sent_email_id,
+                thread_id=email.thread_id,
+                from_address=email.to_address,
+                to_address=email.from_address,
+                subject=subject,
+                body=request.reply_text,
+                snippet=request.reply_text[:200],
+                classification="sent",
+                processed=True,
+            )
+            db.add(sent_email)
+        email.processed = True #type: ignore
+        db.commit()
+        invalidate_stats_cache()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Error sending reply to %s", request.email_id)
+        if to is not None:
+            _record_send_failure(None, to, subject, request.reply_text, sent, e) # type: ignore
+    finally:
+        db.close()
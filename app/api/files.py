@@ -61,12 +61,9 @@ def delete_user_file(file_id: int, db: Session = Depends(get_db)):
     """Delete a persistent user file"""
     user_id = 1 #TODO: get from auth
     
-    user_file = db.query(UserFile).filter(
-        UserFile.id == file_id,
-        UserFile.user_id == user_id
-    ).first()
+    user_file = db.get(UserFile, file_id)
 
-    if not user_file:
+    if not user_file or user_file.user_id != user_id: #type: ignore
         raise HTTPException(status_code=404, detail="File not found")
     
     #Delete from storage
@@ -83,12 +80,9 @@ def get_file_content(file_id: int, db: Session = Depends(get_db)):
     """Get file content"""
     user_id = 1 #TODO: get from auth
 
-    user_file = db.query(UserFile).filter(
-        UserFile.id == file_id,
-        UserFile.user_id == user_id
-    ).first()
+    user_file = db.get(UserFile, file_id)
 
-    if not user_file:
+    if not user_file or user_file.user_id != user_id: #type: ignore
         raise HTTPException(status_code=404, detail="File not found")
 
     file_content = storage_service.get_file_content(filepath=user_file.filepath)#type: ignore
@@ -5,6 +5,13 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(case_sensitive=False, env_file='.env',extra="ignore")
 
     database_url: str
+    # Per engine (sync + async), one process peaks at 2 x (10 + 10) = 40 connections.
+    # Postgres' default max_connections=100 keeps 3 for superusers, 97 leaves room for a
+    # second uvicorn worker plus alembic/psql sessions. Lower these when running more workers
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800 # seconds
+    db_statement_timeout: int = 15000 # milliseconds, Postgres only
 
     google_client_id: str = ""
     google_client_secret: str = ""
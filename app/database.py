@@ -1,20 +1,67 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.core.config import settings
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import orjson
+
+_url = make_url(settings.database_url)
+_is_postgres = _url.get_backend_name() == "postgresql"
+
+def _json_dumps(value) -> str:
+    """JSON/JSONB bind values through orjson, the drivers expect str"""
+    return orjson.dumps(value).decode()
 
 engine = create_engine(
     settings.database_url,
     echo=settings.debug,
-    pool_pre_ping=True
+    pool_pre_ping=True,
+    # keep connections open across requests instead of reconnecting each time
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle,
+    # reuse the most recently returned connection so idle ones can be recycled
+    pool_use_lifo=True,
+    # orjson for JSON/JSONB columns (draft attachments) instead of the stdlib json codec
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
+    # a runaway query gets cancelled instead of pinning a pooled connection
+    connect_args={"options": f"-c statement_timeout={settings.db_statement_timeout}"} if _is_postgres else {}
 )
 
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
+    # keep loaded attributes after commit so returning an object doesn't re-SELECT it
+    expire_on_commit=False,
     bind=engine
 )
 
+# Async engine for `async def` routes, same database through an asyncio driver
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+async_engine = create_async_engine(
+    _url.set(drivername=_ASYNC_DRIVERS.get(_url.get_backend_name(), _url.drivername)),
+    echo=settings.debug,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle,
+    pool_use_lifo=True,
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
+    connect_args={"server_settings": {"statement_timeout": str(settings.db_statement_timeout)}} if _is_postgres else {}
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine
+)
+
 # Base class for models
 Base = declarative_base()
 
@@ -32,4 +79,17 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """
+    Async variant of get_db for `async def` routes
+
+    Usage:
+        @app.get("/items")
+        async def read_items(db: AsyncSession = Depends(get_async_db)):
+            result = await db.execute(select(Item))
+            ...
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api import emails, config, bulk, agent, dashboard, drafts, files,ai, action
@@ -6,10 +7,16 @@ from app.services.agent_service import agent as agent_client
 from app.models.email import Email
 from app.models.action import Action
 from app.database import SessionLocal
+from app.services.stats_service import run_stats_refresher
 import uuid
 
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 import asyncio
+import logging
+import queue
+import threading
 
 
 def reset_demo_db():
@@ -52,20 +59,59 @@ def reset_demo_db():
         finally:
             db.close()
 
+# App loggers only enqueue records, a listener thread does the formatting and stdout writes
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
+_log_listener = QueueListener(_log_queue, _log_handler)
+
+def setup_logging():
+    app_logger = logging.getLogger("app")
+    if not app_logger.handlers:
+        app_logger.setLevel(logging.INFO)
+        app_logger.addHandler(QueueHandler(_log_queue))
+        app_logger.propagate = False
+    _log_listener.start()
+
+# The agent loop is blocking, it gets its own thread so it never stalls the event loop
+_agent_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent")
+
+def start_agent_thread(app: FastAPI) -> bool:
+    """Submit a new agent loop, False if one is already running"""
+    stop_event = agent_client.start()
+    if stop_event is None:
+        return False
+    # a stopped loop still finishing its poll runs first on the single worker, so
+    # awaiting the latest future on shutdown also waits for any older one
+    loop = asyncio.get_running_loop()
+    app.state.agent_fut = loop.run_in_executor(_agent_executor, agent_client.run_loop, stop_event)
+    return True
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(f"Starting up {settings.app_name}...")
     print(f"Database: {settings.database_url.split('@')[1]}") 
+    setup_logging()
     reset_demo_db()
-    asyncio.create_task(agent_client.run_loop())
+    start_agent_thread(app)
+    stats_stop = threading.Event()
+    stats_thread = threading.Thread(target=run_stats_refresher, args=(stats_stop,), name="stats-refresh", daemon=True)
+    stats_thread.start()
     yield
     print(f"Shutting down {settings.app_name}...")
+    agent_client.stop()
+    stats_stop.set()
+    await app.state.agent_fut
+    await asyncio.to_thread(stats_thread.join)
+    _log_listener.stop() # flushes whatever is still queued
 
 app = FastAPI(
     title=settings.app_name,
     description="AI Email Agent with learning capabilities",
     version="0.1.0",
     lifespan=lifespan,
+    # orjson encodes responses (datetimes included) much faster than stdlib json
+    default_response_class=ORJSONResponse,
 )
 
 # CORS: Allow frontend to connect
@@ -108,12 +154,10 @@ def health():
 
 # agent control endpoints
 @app.post("/api/agent/start")
-async def start_agent(background_tasks: BackgroundTasks):
+async def start_agent():
     """Start the background agent service"""
-    if agent_client.running:
+    if not start_agent_thread(app):
         return {"message": "Agent is already running."}
-    
-    background_tasks.add_task(agent_client.run_loop)
     return {"message": "Agent started."}
 
 @app.post("/api/agent/stop")
@@ -13,11 +13,13 @@ class Action(Base):
     id = Column(Integer, primary_key=True, index=True)
 
     # Link to email
-    email_id = Column(String, ForeignKey("emails.id"), nullable=False)
+    email_id = Column(String(36), ForeignKey("emails.id"), nullable=False, index=True)
+    # lazy="raise": callers must eager-load (joinedload/selectinload), a per-row lazy SELECT errors instead
+    email = relationship("Email", lazy="raise")
 
     # What action to take
     action_type = Column(String, nullable=False)  # reply, archive, notify, skip
-    status = Column(String, index=True, default="pending")  # pending, approved, rejected, executed, failed
+    status = Column(String, index=True, default="pending")  # pending, approved, executing, rejected, executed, failed
 
     # Reply content (if action is reply)
     suggested_reply = Column(Text, nullable=True)
@@ -1,7 +1,64 @@
 from sqlalchemy import Column, Integer, String, Boolean, Text
 from sqlalchemy.sql import func
+from typing import FrozenSet, Optional, Pattern, Tuple
+import functools
+import re
 from app.database import Base
 
+@functools.lru_cache(maxsize=4)
+def _parse_csv(raw: str) -> Tuple[str, ...]:
+    """Split a comma separated list into normalized entries, cached by the raw string"""
+    return tuple(entry.strip().lower() for entry in raw.split(",") if entry.strip())
+
+class SenderMatcher:
+    """
+    Matches a lowercased sender address against whitelist/blacklist entries.
+    An entry matches when it's a substring of the sender (noreply@, .edu, amazon.co, john.smith),
+    set lookups answer the common exact cases before the substring pattern runs:
+    1. full addresses (boss@corp.com) - one set lookup
+    2. @corp.com - one set lookup on the sender's domain
+    3. corp.com - set lookups on the sender's domain and its parent domains
+    4. everything, including the above - one compiled pattern of all entries
+    """
+
+    def __init__(self, entries: Tuple[str, ...]):
+        addresses, exact_domains, domains = set(), set(), set()
+        for entry in entries:
+            local, at, domain = entry.rpartition("@")
+            if "." not in domain or domain.startswith("."):
+                continue # only the substring pattern can answer these
+            if local:
+                addresses.add(entry)
+            elif at:
+                exact_domains.add(domain)
+            else:
+                domains.add(domain)
+        self.addresses: FrozenSet[str] = frozenset(addresses)
+        self.exact_domains: FrozenSet[str] = frozenset(exact_domains)
+        self.domains: FrozenSet[str] = frozenset(domains)
+        self.pattern: Optional[Pattern[str]] = (
+            re.compile("|".join(re.escape(entry) for entry in entries)) if entries else None
+        )
+
+    def matches(self, sender: str) -> bool:
+        if sender in self.addresses:
+            return True
+        domain = sender.rpartition("@")[2]
+        if domain in self.exact_domains:
+            return True
+        if self.domains:
+            while domain:
+                if domain in self.domains:
+                    return True
+                domain = domain.partition(".")[2]
+        # every set hit above is also a substring hit, this is the full rule
+        return self.pattern is not None and self.pattern.search(sender) is not None
+
+@functools.lru_cache(maxsize=4)
+def _compile_matcher(raw: str) -> SenderMatcher:
+    """Build the matcher once per raw config string"""
+    return SenderMatcher(_parse_csv(raw))
+
 class AgentConfig(Base):
     """
     Stores agent configuration (whitelist, blacklist, settings)
@@ -24,14 +81,18 @@ class AgentConfig(Base):
     enable_spam_filter = Column(Boolean, default=True)
     enable_learning = Column(Boolean, default=False)
 
-    def get_whitelist(self) -> list:
-        """Parse whitelist into list"""
-        if not self.auto_reply_whitelist: # type: ignore
-            return []
-        return [email.strip().lower() for email in self.auto_reply_whitelist.split(",") if email.strip()]
+    def get_whitelist(self) -> Tuple[str, ...]:
+        """Parse whitelist into a tuple (shared, copy before modifying)"""
+        return _parse_csv(self.auto_reply_whitelist or "") # type: ignore
     
-    def get_blacklist(self) -> list:
-        """Parse blacklist into list"""
-        if not self.auto_reply_blacklist: # type: ignore
-            return []
-        return [email.strip().lower() for email in self.auto_reply_blacklist.split(",") if email.strip()]
\ No newline at end of file
+    def get_blacklist(self) -> Tuple[str, ...]:
+        """Parse blacklist into a tuple (shared, copy before modifying)"""
+        return _parse_csv(self.auto_reply_blacklist or "") # type: ignore
+
+    def whitelist_matcher(self) -> SenderMatcher:
+        """Compiled sender matcher for the whitelist"""
+        return _compile_matcher(self.auto_reply_whitelist or "") # type: ignore
+
+    def blacklist_matcher(self) -> SenderMatcher:
+        """Compiled sender matcher for the blacklist"""
+        return _compile_matcher(self.auto_reply_blacklist or "") # type: ignore
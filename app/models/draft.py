@@ -1,15 +1,26 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 from sqlalchemy.sql import func
 from app.database import Base
 
 class Draft(Base):
     __tablename__ = "drafts"
+    __table_args__ = (
+        Index("ix_drafts_attach_gin", "attachments", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     to = Column(String)
     subject = Column(String)
     body = Column(Text)
-    attachments = Column(JSON, default=list) #list of file paths
+    attachments = Column(
+        JSON().with_variant(JSONB, "postgresql"),
+        default=list,
+        server_default=text("'[]'"),
+        nullable=False
+    ) #list of file info dicts, JSONB so Postgres can append/filter in place
+    # set when a background send of this draft failed, so the UI can show it and retry
+    send_error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Text
+from sqlalchemy import Column, String, DateTime, Boolean, Text, Computed, FetchedValue, Index, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -7,9 +9,20 @@ class Email(Base):
     Stores emails processed by the agent
     """
     __tablename__ = "emails"
+    __table_args__ = (
+        Index("ix_emails_search_tsv", "search_tsv", postgresql_using="gin"),
+        #Latest-per-thread and unprocessed listings, both newest first
+        Index("ix_emails_thread_created", "thread_id", text("created_at DESC")),
+        Index("ix_emails_processed_created", "processed", text("created_at DESC")),
+        #Partial index on the agent's unprocessed-id poll, stays small once the backlog clears
+        Index("ix_emails_unprocessed", "id", postgresql_where=text("processed = false")),
+        #Trigram indexes back the ILIKE '%query%' searches
+        Index("ix_emails_subject_trgm", "subject", postgresql_using="gin", postgresql_ops={"subject": "gin_trgm_ops"}),
+        Index("ix_emails_body_trgm", "body", postgresql_using="gin", postgresql_ops={"body": "gin_trgm_ops"}),
+    )
 
     #Primary Key
-    id = Column(String, primary_key=True)
+    id = Column(String(36), primary_key=True) #Gmail ids are 16 hex chars, demo/locally sent ids are uuid4
 
     #Metadata
     thread_id = Column(String, index=True) #indexed for querying
@@ -19,7 +32,13 @@ class Email(Base):
     to_address = Column(String)
     subject = Column(Text)
     snippet = Column(Text)
-    body = Column(Text)
+    body = deferred(Column(Text)) #can be large, only loaded where it's shown (undefer) or on access
+
+    #Full-text search over subject + body, maintained by Postgres (deferred, only used in filters)
+    search_tsv = deferred(Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', coalesce(subject, '') || ' ' || coalesce(body, ''))", persisted=True)
+    ))
 
     #Classification
     classification = Column(String, index=True) #urgent, routine, spam, personal
@@ -29,7 +48,7 @@ class Email(Base):
 
     #Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_onupdate=FetchedValue(), nullable=True) #set by the trg_emails_updated_at trigger
 
     def __repr__(self):
         return f"<Email {self.id}: {self.subject[:30]}...>"
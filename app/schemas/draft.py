@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import List
 
@@ -18,8 +18,8 @@ class DraftResponse(BaseModel):
     subject: str
     body: str
     attachments: List[dict] = []
+    send_error: str | None = None
     created_at: datetime
     updated_at: datetime | None
 
-    class Config:
-        from_attributes = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
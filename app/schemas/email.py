@@ -26,6 +26,26 @@ class EmailResponse(EmailBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class EmailSummary(BaseModel):
+    """For list/search responses, everything but the body"""
+    id: str
+    thread_id: Optional[str] = None
+    subject: str
+    from_address: str
+    to_address: str
+    snippet: Optional[str] = None
+    classification: Optional[str] = None
+    processed: bool
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class EmailThreadResponse(EmailSummary):
+    """Latest email of a thread, with counts for the whole thread"""
+    thread_count: int
+    has_unread: bool
+
 class SendReplyRequest(BaseModel):
     email_id: str
     reply_text: str
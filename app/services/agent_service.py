@@ -1,15 +1,26 @@
-import asyncio
 import os
-from datetime import datetime
+import logging
+import threading
 from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, update
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
-from app.services.gmail_client import GmailClient
-from app.services.demo_gmail_client import DemoGmailClient
+from app.services.gmail_provider import get_gmail_client
 from app.models.email import Email
 from app.models.action import Action
 from app.database import SessionLocal
-from app.models.config import AgentConfig
 from app.core.config import settings
+from app.services.config_service import ConfigSnapshot, get_cached_config
+from app.services.stats_service import invalidate_stats_cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent OpenAI calls per poll, keeps us under the account rate limit
+MAX_CONCURRENT_LLM_CALLS = 8
+
+# Emails per batched classification call
+CLASSIFY_BATCH_SIZE = 20
 
 class AgentService:
     """
@@ -23,22 +34,19 @@ class AgentService:
     def __init__(self):
         use_demo = settings.demo_mode
         print(f"Using DEMO_MODE: {use_demo}")
-        self.gmail_client = DemoGmailClient() if use_demo else GmailClient()
-        self.seen_emails = set()
+        self.gmail_client = get_gmail_client()
         self.running = False
+        self._stop_event = threading.Event()
+        self._run_lock = threading.Lock() # start/stop come from request handlers and shutdown
+        self._llm_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS, thread_name_prefix="agent-llm")
     
-    def get_config(self, db: Session) -> AgentConfig:
+    def get_config(self, db: Session) -> ConfigSnapshot:
         """
-        Fetch the agent configuration from the database.
-        If none exists, create a default one.
+        Fetch the agent configuration, creating a default one if none exists.
+        Shares the config API's 30s cache (invalidated on every config write),
+        so a poll doesn't hit the DB once per email
         """
-        config = db.query(AgentConfig).filter(AgentConfig.id == 1).first()
-        if not config:
-            config = AgentConfig()
-            db.add(config)
-            db.commit()
-            db.refresh(config)
-        return config
+        return get_cached_config(db)
     
     def check_for_new_emails(self, db: Session) -> list:
         """
@@ -47,112 +55,146 @@ class AgentService:
         Returns a list of email IDs that are new
         """
         if settings.demo_mode:
-            has_action=False
-            unread = db.query(Email).filter(Email.processed == False).all()
-            new = []
-            for e in self.seen_emails:
-               has_action = db.query(Action).filter(Action.email_id == e.id).first()
-            if not has_action:
-                new.append(e.id)
-            return new
+            # Unprocessed demo emails that don't have an action yet, two queries total
+            unread_ids = [email_id for (email_id,) in db.query(Email.id).filter(Email.processed == False).all()]
+            has_action = {
+                email_id for (email_id,) in
+                db.query(Action.email_id).filter(Action.email_id.in_(unread_ids)).all()
+            }
+            return [email_id for email_id in unread_ids if email_id not in has_action]
         unread = self.gmail_client.list_messages(max_results=100, query="is:unread")
+        ids = [msg["id"] for msg in unread]
 
-        new_emails = []
-        for msg in unread:
-            email_id = msg["id"]
+        # skip ones already in db (one IN query), save_batch commits every processed email
+        known = {email_id for (email_id,) in db.query(Email.id).filter(Email.id.in_(ids)).all()}
+        return [email_id for email_id in ids if email_id not in known]
 
-            # skip if already in db
-            existing = db.query(Email).filter(Email.id == email_id).first()
-            if existing:
-                continue
+    def fetch_emails(self, email_ids: List[str], db: Session) -> List[dict]:
+        """
+        Fetch and parse a poll's emails (from the DB in demo mode), in input order.
+        One batched Gmail fetch (or one IN query) instead of a round trip per email.
+        Runs on the agent thread, the Gmail client isn't thread-safe
+        """
+        if settings.demo_mode:
+            # only the parsed fields, skips flags and timestamps
+            rows = db.execute(
+                select(
+                    Email.id, Email.thread_id, Email.from_address, Email.from_name, Email.from_raw,
+                    Email.to_address, Email.subject, Email.snippet, Email.body
+                ).where(Email.id.in_(email_ids))
+            ).all()
+            by_id = {
+                row.id: {
+                    "id": row.id,
+                    "threadId": row.thread_id,
+                    "from": row.from_address,
+                    "name": row.from_name,
+                    "from-raw": row.from_raw,
+                    "to": row.to_address,
+                    "subject": row.subject,
+                    "snippet": row.snippet,
+                    "body": row.body,
+                }
+                for row in rows
+            }
+            return [by_id[email_id] for email_id in email_ids if email_id in by_id]
 
-            # skip if already seen in this session
-            if email_id in self.seen_emails:
-                continue
-                
-            new_emails.append(email_id)
-        
-        return new_emails
+        # fetch from gmail, already parsed ones come from the client's cache
+        parsed = self.gmail_client.get_parsed_messages(email_ids)
+        return [parsed[email_id] for email_id in email_ids if email_id in parsed]
 
-    def process_email(self, email_id: str, db: Session):
+    def prefetch_classifications(self, parsed_emails: List[dict]):
         """
-        Process a single email:
-        1. Fetch from Gmail
-        2. Parse and classify
-        3. Save to DB
-        4. Create action
+        Classify a poll's emails CLASSIFY_BATCH_SIZE per OpenAI call, chunks run concurrently.
+        Labels land in the client's response cache, so process_email's classify_email is a hit.
+        A failed chunk is only logged, its emails get classified one by one in process_email
         """
-        print(f"Processing email: {email_id}")
+        chunks = [
+            parsed_emails[start:start + CLASSIFY_BATCH_SIZE]
+            for start in range(0, len(parsed_emails), CLASSIFY_BATCH_SIZE)
+        ]
+        futures = [self._llm_pool.submit(self.gmail_client.classify_emails_batch, chunk) for chunk in chunks]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error("Batch classification failed, classifying one by one: %s", e)
 
-        # fetch from gmail
-        if settings.demo_mode:
-            email = db.query(Email).filter(Email.id == email_id).first()
-            parsed_email = {
-                "id": email.id, #type:ignore
-                "threadId": email.thread_id,#type:ignore
-                "from": email.from_address,#type:ignore
-                "name": email.from_name,#type:ignore
-                "from-raw": email.from_raw,#type:ignore
-                "to": email.to_address,#type:ignore
-                "subject": email.subject,#type:ignore
-                "snippet": email.snippet,#type:ignore
-                "body": email.body,#type:ignore
-            }
-        else:
-            raw_email = self.gmail_client.get_message(email_id)
-            parsed_email = self.gmail_client.parse_message(raw_email)
+    def process_email(self, parsed_email: dict, config: ConfigSnapshot) -> Tuple[dict, dict]:
+        """
+        Process a single fetched email:
+        1. Classify
+        2. Build the email row (a classification update in demo mode, the row already exists)
+        3. Decide and build the action row
 
-        # classify with AI
-        classification = self.gmail_client.classify_email(parsed_email)
+        Only does OpenAI calls, so run_loop fans these out over a thread pool.
+        Nothing is committed here, run_loop saves the whole poll with save_batch
+        """
+        # classify with AI, senders that get auto-replies classify and draft in one call
+        reply = None
+        if self._is_auto_reply_sender(parsed_email, config):
+            result = self.gmail_client.classify_and_reply(parsed_email)
+            classification, reply = result["classification"], result["reply"]
+        else:
+            classification = self.gmail_client.classify_email(parsed_email)
 
-        print(f"    From: {parsed_email['from']}")
-        print(f"    Subject: {parsed_email['subject']}")
-        print(f"    Classification: {classification}")
+        logger.info("    %s from=%s subject=%r classification=%s",
+                    parsed_email["id"], parsed_email["from"], parsed_email["subject"], classification)
 
         if not settings.demo_mode:
-            db_email = Email(
-                id=parsed_email["id"],
-                thread_id=parsed_email["threadId"],
-                from_address=parsed_email["from"],
-                from_name=parsed_email["name"],
-                from_raw=parsed_email["from-raw"],
-                to_address=parsed_email.get("to", ""),
-                subject=parsed_email["subject"],
-                snippet=parsed_email.get("snippet", ""),
-                body=parsed_email.get("body", ""),
-                classification=classification,
-                processed=False,
-            )
-            db.add(db_email)
-            db.commit()
+            email_row = {
+                "id": parsed_email["id"],
+                "thread_id": parsed_email["threadId"],
+                "from_address": parsed_email["from"],
+                "from_name": parsed_email["name"],
+                "from_raw": parsed_email["from-raw"],
+                "to_address": parsed_email.get("to", ""),
+                "subject": parsed_email["subject"],
+                "snippet": parsed_email.get("snippet", ""),
+                "body": parsed_email.get("body", ""),
+                "classification": classification,
+                "processed": False,
+            }
         else:
             # demo mode: update existing record
-            email = db.query(Email).filter(Email.id == parsed_email["id"]).first()
-            email.classification = classification #type:ignore
-            db.commit()
+            email_row = {"id": parsed_email["id"], "classification": classification}
 
         
         # decide action
-        action = self.decide_action(parsed_email, classification, db)
+        action = self.decide_action(parsed_email, classification, config, reply=reply)
 
-        db_action = Action(
-            email_id=parsed_email["id"],
-            action_type=action['type'],
-            suggested_reply=action.get('message', None),
-            reason=action['reason'],
-            status='pending'
-        )
+        action_row = {
+            "email_id": parsed_email["id"],
+            "action_type": action['type'],
+            "suggested_reply": action.get('message', None),
+            "reason": action['reason'],
+            "status": 'pending',
+        }
 
-        db.add(db_action)
-        db.commit()
+        logger.info("    %s action=%s - %s", parsed_email["id"], action["type"], action["reason"])
 
-        print(f"    Saved! Action: {action['type']} - {action['reason']}")
+        return email_row, action_row
 
-        # mark as seen
-        self.seen_emails.add(email_id)
+    def save_batch(self, db: Session, email_rows: List[dict], action_rows: List[dict]):
+        """
+        Write a poll's emails and actions with one executemany each and a single commit
+        """
+        if email_rows:
+            # demo rows already exist, only their classification changes
+            db.execute(update(Email) if settings.demo_mode else insert(Email), email_rows)
+        if action_rows:
+            db.execute(insert(Action), action_rows)
+        db.commit()
+        invalidate_stats_cache()
+        logger.info("    Saved %d action(s)", len(action_rows))
 
     
-    def decide_action(self, parsed_email: dict, classification: str, db: Session) -> dict:
+    def _is_auto_reply_sender(self, parsed_email: dict, config: ConfigSnapshot) -> bool:
+        """Whitelisted and not blacklisted, i.e. decide_action will want a reply for non-urgent mail"""
+        sender = parsed_email['from'].lower()
+        return config.whitelist_matcher().matches(sender) and not config.blacklist_matcher().matches(sender)
+
+    def decide_action(self, parsed_email: dict, classification: str, config: ConfigSnapshot, reply: Optional[str] = None) -> dict:
         """
         Decide what action to take based on classification
         
@@ -160,29 +202,28 @@ class AgentService:
         1. type: reply, archive, notify, skip
         2. message: suggested reply (if type is reply)
         3. reason: explanation for the action
+
+        reply is a draft already generated alongside the classification, one is
+        generated here only if it's needed and missing
         """
         sender = parsed_email['from'].lower()
         
-        # Whitelist/Blacklist (copy from your config or make configurable)
-        config = self.get_config(db)
-        AUTO_REPLY_WHITELIST = config.get_whitelist()
-        AUTO_REPLY_BLACKLIST = config.get_blacklist()
-        
-        # Check blacklist first
-        if any(blocked in sender for blocked in AUTO_REPLY_BLACKLIST):
+        # Check blacklist first, matchers are built once per config value
+        if config.blacklist_matcher().matches(sender):
             return {
                 'type': 'notify',
                 'reason': f'Blacklisted sender: {sender}'
             }
         
         # Check if whitelisted
-        is_whitelisted = any(allowed in sender for allowed in AUTO_REPLY_WHITELIST)
+        is_whitelisted = config.whitelist_matcher().matches(sender)
         
         # Whitelisted senders get special treatment
         if is_whitelisted:
             if classification in ['routine', 'spam', 'personal']:
                 # Auto-reply even if spam/personal (they're trusted)
-                reply = self.gmail_client.generate_smart_reply(parsed_email)
+                if not reply:
+                    reply = self.gmail_client.generate_smart_reply(parsed_email)
                 return {
                     'type': 'reply',
                     'message': reply,
@@ -225,46 +266,81 @@ class AgentService:
                 'reason': f'Unknown classification: {classification}'
             }
     
-    async def run_loop(self, check_interval: int = 60):
+    def start(self) -> Optional[threading.Event]:
+        """
+        Mark the agent running and return the stop event for the run_loop about to be
+        submitted, None if it's already running. Each run gets its own event, so a stop
+        requested before the loop begins (or an older loop still finishing) is never undone
         """
-        Main agent loop - runs continuously in the background
+        with self._run_lock:
+            if self.running:
+                return None
+            self.running = True
+            self._stop_event = threading.Event()
+            return self._stop_event
+
+    def run_loop(self, stop_event: threading.Event, check_interval: int = 60):
+        """
+        Main agent loop - runs continuously on a worker thread, all the
+        Gmail/DB/OpenAI calls here are blocking
 
         Args:
+            stop_event: the event start() returned, set by stop()
             check_interval: seconds between checks
         """
-        print(f"Agent starting...(check every {check_interval}s)")
-        self.running = True
+        logger.info("Agent starting...(check every %ss)", check_interval)
 
-        while self.running:
+        while not stop_event.is_set():
             try:
                 # create db session
                 db = SessionLocal()
                 try:
                     new_emails = self.check_for_new_emails(db)
                     if new_emails:
-                        print(f"Found {len(new_emails)} new emails.")
+                        logger.info("Found %d new emails.", len(new_emails))
 
-                        for email_id in new_emails:
+                        parsed_emails = self.fetch_emails(new_emails, db)
+                        logger.info("Fetched %d of %d emails.", len(parsed_emails), len(new_emails))
+
+                        # classify + reply calls are network bound, run them concurrently
+                        config = self.get_config(db)
+                        # auto-reply senders classify together with their reply in process_email
+                        self.prefetch_classifications([
+                            parsed for parsed in parsed_emails if not self._is_auto_reply_sender(parsed, config)
+                        ])
+                        futures = {
+                            parsed["id"]: self._llm_pool.submit(self.process_email, parsed, config)
+                            for parsed in parsed_emails
+                        }
+                        email_rows, action_rows = [], []
+                        for email_id, future in futures.items():
                             try:
-                                self.process_email(email_id, db)
+                                email_row, action_row = future.result()
                             except Exception as e:
-                                print(f"Error processing email {email_id}: {e}")
+                                logger.error("Error processing email %s: %s", email_id, e)
+                                continue
+                            email_rows.append(email_row)
+                            action_rows.append(action_row)
+                        if action_rows:
+                            self.save_batch(db, email_rows, action_rows)
                     else:
-                        print(f"No new emails found at {datetime.now().strftime('%H:%M:%S')}.")
+                        logger.info("No new emails found.")
                 finally:
                     db.close()
             
 
-                await asyncio.sleep(check_interval)
+                stop_event.wait(check_interval)
             except Exception as e:
-                print(f"Error in agent loop: {e}")
-                await asyncio.sleep(check_interval)
+                logger.error("Error in agent loop: %s", e)
+                stop_event.wait(check_interval)
     
     def stop(self):
         """
         Stop the agent loop
         """
-        self.running = False
-        print("Agent stopping...")
+        with self._run_lock:
+            self.running = False
+            self._stop_event.set() # wake the loop instead of waiting out the interval
+        logger.info("Agent stopping...")
 
 agent = AgentService()
\ No newline at end of file
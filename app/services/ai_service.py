@@ -1,13 +1,25 @@
-from openai import OpenAI
+from app.services.openai_client import client
 from pydantic import BaseModel
 from typing import Optional, List
 from app.schemas.ai import AttachedFile
-from app.core.config import settings
 import logging
 
+# Static prompt sections, built once
+_ATTACHMENTS_HEADER = "\n\nAttached documents for context: \n"
+_RESEARCH_INSTRUCTIONS = """\n
+            IMPORTANT: Before drafting, research the recipient's company, recent news, and relevant industry trends to personalize this
+            email. Use web search to find:
+                - Company information and recent developments
+                - Recipient's role and background (if publicly available)
+                - Industry context and pain points
+                - Relevant news or events to reference
+            Then draft a highly personalized, compelling email that references specific details you discovered
+            """
+_FOOTER = "\n\nPlease draft the email body only. Do NOT include subject line or headers."
+
 class AIService:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.client = client
     
     def generate_email(
             self,
@@ -22,29 +34,22 @@ class AIService:
         Generate email with additional file/research support
         """
         
-        prompt = f"""You are helping draft a professional email.
+        parts = [f"""You are helping draft a professional email.
 
         Recipient: {to}
         Subject: {subject}
         Tone: {tone}
 
         Instructions: {instructions}
-        """
+        """]
         if attached_files:
-            prompt += "\n\nAttached documents for context: \n"
-            for file in attached_files:
-                prompt += f"\n ---{file.filename}--- \n{file.content}\n"
+            parts.append(_ATTACHMENTS_HEADER)
+            parts.extend(f"\n ---{file.filename}--- \n{file.content}\n" for file in attached_files)
         if enable_research:
-            prompt += """\n
-            IMPORTANT: Before drafting, research the recipient's company, recent news, and relevant industry trends to personalize this
-            email. Use web search to find:
-                - Company information and recent developments
-                - Recipient's role and background (if publicly available)
-                - Industry context and pain points
-                - Relevant news or events to reference
-            Then draft a highly personalized, compelling email that references specific details you discovered
-            """
-        prompt += f"\n\nPlease draft the email body only. Do NOT include subject line or headers."
+            parts.append(_RESEARCH_INSTRUCTIONS)
+        parts.append(_FOOTER)
+        # one join instead of re-copying the prompt on every +=
+        prompt = "".join(parts)
 
         response = self.client.responses.create(
             model="gpt-5-mini-2025-08-07",
@@ -0,0 +1,82 @@
+from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from dataclasses import dataclass
+from typing import Tuple
+import threading
+
+from app.models import AgentConfig
+from app.models.config import SenderMatcher, _compile_matcher, _parse_csv
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Immutable copy of the AgentConfig row. Safe to share between request sessions and the
+    agent's threads, unlike the ORM instance, which expires with the session that loaded it
+    """
+    id: int
+    auto_reply_whitelist: str
+    auto_reply_blacklist: str
+    check_interval: int
+    dry_run_mode: bool
+    enable_auto_reply: bool
+    enable_spam_filter: bool
+    enable_learning: bool
+
+    @classmethod
+    def from_model(cls, config: AgentConfig) -> "ConfigSnapshot":
+        return cls(
+            id=config.id, # type: ignore
+            auto_reply_whitelist=config.auto_reply_whitelist or "", # type: ignore
+            auto_reply_blacklist=config.auto_reply_blacklist or "", # type: ignore
+            check_interval=config.check_interval, # type: ignore
+            dry_run_mode=config.dry_run_mode, # type: ignore
+            enable_auto_reply=config.enable_auto_reply, # type: ignore
+            enable_spam_filter=config.enable_spam_filter, # type: ignore
+            enable_learning=config.enable_learning, # type: ignore
+        )
+
+    def get_whitelist(self) -> Tuple[str, ...]:
+        return _parse_csv(self.auto_reply_whitelist)
+
+    def get_blacklist(self) -> Tuple[str, ...]:
+        return _parse_csv(self.auto_reply_blacklist)
+
+    def whitelist_matcher(self) -> SenderMatcher:
+        return _compile_matcher(self.auto_reply_whitelist)
+
+    def blacklist_matcher(self) -> SenderMatcher:
+        return _compile_matcher(self.auto_reply_blacklist)
+
+# Config is read far more often than written, reads are served from here for up to 30s
+_config_cache: TTLCache = TTLCache(maxsize=1, ttl=30)
+_config_lock = threading.Lock()
+# Bumped by every invalidation, a load that started before one isn't stored
+_config_generation = 0
+
+def get_or_create_config(db: Session) -> AgentConfig:
+    """Get config or create config if it doesn't exist"""
+    config = db.get(AgentConfig, 1)
+    if not config:
+        config = AgentConfig()
+        db.add(config)
+        db.commit()
+    return config
+
+def get_cached_config(db: Session) -> ConfigSnapshot:
+    """Read-only config snapshot, cached. Endpoints that modify config use get_or_create_config"""
+    with _config_lock:
+        config = _config_cache.get(1)
+        generation = _config_generation
+    if config is None:
+        config = ConfigSnapshot.from_model(get_or_create_config(db))
+        with _config_lock:
+            if generation == _config_generation:
+                _config_cache[1] = config
+    return config
+
+def invalidate_config_cache():
+    """Drop the cached config after any write"""
+    global _config_generation
+    with _config_lock:
+        _config_generation += 1
+        _config_cache.clear()
@@ -1,12 +1,11 @@
 import uuid
 from datetime import datetime
-from typing import List
-from openai import OpenAI
-from app.core.config import settings
-
-
-client = OpenAI(api_key=settings.openai_api_key)
-
+from typing import Iterator, List
+from app.services.openai_client import cached_output_text, client
+from app.services.gmail_client import (
+    CLASSIFY_MODEL, SMART_REPLY_MAX_TOKENS, SMART_REPLY_MODEL, classification_prompt,
+    classify_and_reply, classify_emails_batch, smart_reply_prompt, stream_smart_reply
+)
 
 class DemoGmailClient:
     def __init__(self):
@@ -45,6 +44,18 @@ class DemoGmailClient:
     def get_message(self, message_id: str) -> dict:
         return self._emails[message_id]
 
+    def get_message_metadata(self, message_id: str) -> dict:
+        return self._emails[message_id]
+
+    def get_messages_batch(self, message_ids: List[str], fmt: str = 'full') -> dict:
+        return {eid: self._emails[eid] for eid in message_ids if eid in self._emails}
+
+    def get_parsed_messages(self, message_ids: List[str]) -> dict:
+        return self.get_messages_batch(message_ids)
+
+    async def get_messages_async(self, message_ids: List[str], fmt: str = 'full', concurrency: int = 20) -> dict:
+        return self.get_messages_batch(message_ids, fmt)
+
     def parse_message(self, raw: dict) -> dict:
         return raw
 
@@ -54,38 +65,30 @@ class DemoGmailClient:
     def archive(self, message_id: str):
         self._unread_ids.discard(message_id)
 
-    def generate_smart_reply(self, parsed_email: dict) -> str:
-        """Generate a single, contextually appropriate reply with tone support"""
-        
-        tone = parsed_email.get('tone', 'professional')
-        custom_instructions = parsed_email.get('instructions', '')
-        # Tone mappings
-        tone_instructions = {
-            'professional': 'Write a professional and polite reply.',
-            'casual': 'Write a casual and friendly reply.',
-            'friendly': 'Write a warm and friendly reply.',
-            'brief': 'Write a very brief and concise reply (2-3 sentences max).',
-        }
-        tone_instruction = tone_instructions.get(tone, tone_instructions["professional"])
-        prompt = f"""Generate ONLY the body of an email reply. Do NOT include subject line or headers.
-
-        From: {parsed_email['from']}
-        Subject: {parsed_email['subject']}
-        Body: {parsed_email['body']}
-
-        {tone_instruction}
-        {custom_instructions}
+    def batch_modify(self, message_ids: List[str], body: dict) -> List[dict]:
+        for message_id in message_ids:
+            self._unread_ids.discard(message_id)
+        return []
 
-        Based on the sender and content, write a helpful reply. Keep it concise but helpful. 
-        Write ONLY the reply body text with appropriate tone. Start directly with the greeting."""
+    def batch_trash(self, message_ids: List[str]) -> List[dict]:
+        for message_id in message_ids:
+            self._unread_ids.discard(message_id)
+        return []
 
+    def generate_smart_reply(self, parsed_email: dict) -> str:
+        """Generate a single, contextually appropriate reply with tone support"""
         response = client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt
+            model=SMART_REPLY_MODEL,
+            input=smart_reply_prompt(parsed_email),
+            max_output_tokens=SMART_REPLY_MAX_TOKENS
         )
     
         return response.output_text
 
+    def generate_smart_reply_stream(self, parsed_email: dict) -> Iterator[str]:
+        """generate_smart_reply, yielding text as it's generated"""
+        return stream_smart_reply(parsed_email)
+
 
     def classify_email(self, parsed_email: dict) -> str:
         """Classify email as urgent, personal, routine, or spam
@@ -96,18 +99,27 @@ class DemoGmailClient:
         :return: Classification of the email as either 'urgent', 'personal', 'routine', or 'spam'
         :rtype: str
         """
-        prompt = f"""Classify this email as one of: urgent, personal, routine, or spam
+        return cached_output_text(CLASSIFY_MODEL, classification_prompt(parsed_email)).strip().lower()
 
-                Subject: {parsed_email['subject']}
-                From: {parsed_email['from']}
-                Preview: {parsed_email['snippet']}
+    def classify_emails_batch(self, parsed_emails: List[dict]) -> List[str]:
+        """Classify several emails with one OpenAI call, see classify_emails_batch"""
+        return classify_emails_batch(parsed_emails)
 
-                Respond with just one word: urgent, personal, routine, or spam"""
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt
-        )
-        return response.output_text.strip().lower()
+    def classify_and_reply(self, parsed_email: dict) -> dict:
+        """Classify an email and draft a reply in one OpenAI call
+
+        Used when the reply is likely needed (whitelisted senders), saves the
+        second round trip of classify_email + generate_smart_reply
+
+        :param parsed_email: Parsed email dict with subject, from, snippet and body
+        :type parsed_email: dict
+        :return: {'classification': ..., 'reply': ...}, reply is empty for urgent emails
+        :rtype: dict
+        """
+        result = classify_and_reply(parsed_email)
+        if result is None:
+            return {"classification": self.classify_email(parsed_email), "reply": None}
+        return result
     
     def send_email(self, to: str, subject: str, body: str, thread_id=None):
         print(f"📤 [DEMO] Sent email to {to}: {subject}")
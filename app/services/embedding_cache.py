@@ -0,0 +1,70 @@
+import operator
+import threading
+from array import array
+from collections import deque
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from app.services.openai_client import async_client, client
+
+# Embeddings are ~10x cheaper than a chat call, 256 dimensions keep the pure-Python dot products cheap
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 256
+
+# Cosine similarity above which an email reuses its nearest neighbour's label instead of calling GPT
+SIMILARITY_THRESHOLD = 0.92
+
+# Labeled emails kept for lookup, oldest dropped first
+INDEX_SIZE = 512
+
+def _unit(vector: Sequence[float]) -> array:
+    """Normalize so a dot product is the cosine similarity"""
+    norm = sum(x * x for x in vector) ** 0.5 or 1.0
+    return array('f', (x / norm for x in vector))
+
+def embedding_text(parsed_email: dict) -> str:
+    return f"{parsed_email.get('subject') or ''}\n{parsed_email.get('snippet') or ''}".strip()
+
+def embed_texts(texts: List[str]) -> List[array]:
+    """One embeddings call for all texts, unit vectors in input order"""
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts, dimensions=EMBEDDING_DIMENSIONS)
+    return [_unit(item.embedding) for item in sorted(response.data, key=lambda item: item.index)]
+
+async def async_embed_texts(texts: List[str]) -> List[array]:
+    """embed_texts for `async def` callers"""
+    response = await async_client.embeddings.create(model=EMBEDDING_MODEL, input=texts, dimensions=EMBEDDING_DIMENSIONS)
+    return [_unit(item.embedding) for item in sorted(response.data, key=lambda item: item.index)]
+
+class SimilarityCache:
+    """
+    Bounded (unit vector, value) store looked up by cosine similarity.
+    Shared across threads (the agent's LLM pool), so guarded by a lock
+    """
+
+    def __init__(self, maxlen: int):
+        self._entries: deque = deque(maxlen=maxlen) # (unit vector, value)
+        self._lock = threading.Lock()
+
+    def nearest(self, vector: array, match: Optional[Callable[[Any], bool]] = None) -> Optional[Tuple[float, Any]]:
+        """(similarity, value) of the closest entry whose value passes match, None if there is none"""
+        with self._lock:
+            entries = list(self._entries)
+        best = None
+        for other, value in entries:
+            if match is not None and not match(value):
+                continue
+            score = sum(map(operator.mul, vector, other))
+            if best is None or score > best[0]:
+                best = (score, value)
+        return best
+
+    def has(self, match: Callable[[Any], bool]) -> bool:
+        """Whether any entry's value passes match, to skip embedding when no lookup could hit"""
+        with self._lock:
+            return any(match(value) for _, value in self._entries)
+
+    def add(self, vector: array, value: Any):
+        with self._lock:
+            self._entries.append((vector, value))
+
+# Embeddings of emails GPT already classified, with their labels. Near-duplicates
+# (newsletters, notifications, repeated threads) take the label of their closest match
+label_index = SimilarityCache(maxlen=INDEX_SIZE)
@@ -1,22 +1,58 @@
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, build_http
+from googleapiclient.model import JsonModel
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
-from email import encoders
+import asyncio
 import base64
+import functools
 import html
+import httpx
+import io
+import json
+import mimetypes
+import orjson
 import os
-from openai import OpenAI
+import re
+import threading
+import uuid
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Iterator, Literal, Optional, List
 from email.utils import parseaddr
-from app.core.config import settings
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from app.services.openai_client import cached_output_parsed, cached_output_text, client, get_cached_text, set_cached_text
+from app.services.embedding_cache import SIMILARITY_THRESHOLD, embed_texts, embedding_text, label_index
+from app.services.storage import storage_service
 
-client = OpenAI(api_key=settings.openai_api_key)
+# Gmail's batch endpoint accepts at most 100 sub-requests per call
+BATCH_SIZE = 100
+
+# Messages a batch couldn't return are fetched one by one on this many threads
+RETRY_WORKERS = 8
+
+GMAIL_API_URL = "https://gmail.googleapis.com/gmail/v1/users/me"
+
+# Messages above this are sent as a resumable upload, smaller ones in a single request
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+
+# Parsed messages kept in memory, a message's content never changes for its id
+PARSED_CACHE_SIZE = 1024
+PARSED_HEADERS = frozenset(("subject", "from", "to", "date"))
+# Headers requested with format='metadata', which skips the MIME tree and bodies
+METADATA_HEADERS = ["Subject", "From", "To", "Date"]
+
+# CRLF or a lone CR, folded to \n in one pass
+_NEWLINE_RE = re.compile(r'\r\n?')
+# base64url alphabet to standard base64, built once
+_URLSAFE_TRANSLATION = bytes.maketrans(b'-_', b'+/')
 
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.send',
@@ -29,6 +65,209 @@ class PotentialReplies(BaseModel):
     professional: str = Field(description="Formal, professional reply")
     detailed: str = Field(description="Thorough, detailed reply")
 
+class ClassifiedReply(BaseModel):
+    classification: Literal["urgent", "personal", "routine", "spam"]
+    reply: str = Field(description="Reply body, empty for urgent emails")
+
+class Classifications(BaseModel):
+    labels: List[Literal["urgent", "personal", "routine", "spam"]] = Field(description="One label per email, in order")
+
+CLASSIFY_MODEL = "gpt-4o-mini"
+
+# Matches any run of leading "Re:" prefixes (case insensitive)
+_RE_PREFIX = re.compile(r'^(?:re:\s*)+', re.IGNORECASE)
+
+def reply_subject(subject: Optional[str]) -> str:
+    """Subject for a reply, a single "Re: " however many the original already had"""
+    return f"Re: {_RE_PREFIX.sub('', subject or '').strip()}"
+
+def classification_prompt(parsed_email: dict) -> str:
+    """Single email classification prompt, also the cache key for that email's label"""
+    return f"""Classify this email as one of: urgent, personal, routine, or spam
+
+                Subject: {parsed_email['subject']}
+                From: {parsed_email['from']}
+                Preview: {parsed_email['snippet']}
+
+                Respond with just one word: urgent, personal, routine, or spam"""
+
+def classify_emails_batch(parsed_emails: List[dict]) -> List[str]:
+    """
+    Classify several emails in one structured-output call, labels in input order.
+    Emails already classified (cached under their single email prompt) are not sent again,
+    near-duplicates of emails GPT labeled before take that label (one embeddings call),
+    new labels are cached the same way so classify_email picks them up too.
+    Keep batches small (~20), falls back to classify_email per email on a bad response
+
+    :param parsed_emails: Parsed email dicts with subject, from, and snippet
+    :type parsed_emails: List[dict]
+    :return: One of 'urgent', 'personal', 'routine', or 'spam' per email
+    :rtype: List[str]
+    """
+    prompts = [classification_prompt(parsed_email) for parsed_email in parsed_emails]
+    labels = [get_cached_text(CLASSIFY_MODEL, prompt) for prompt in prompts]
+    missing = [i for i, label in enumerate(labels) if label is None]
+
+    vectors = {}
+    texts = {i: text for i in missing if (text := embedding_text(parsed_emails[i]))}
+    if texts:
+        try:
+            vectors = dict(zip(texts, embed_texts(list(texts.values()))))
+        except Exception as e:
+            print(f"⚠️ Warning: Could not embed emails, classifying them all with GPT: {e}")
+        for i, vector in vectors.items():
+            match = label_index.nearest(vector)
+            if match is not None and match[0] >= SIMILARITY_THRESHOLD:
+                labels[i] = match[1]
+                set_cached_text(CLASSIFY_MODEL, prompts[i], match[1])
+        missing = [i for i in missing if labels[i] is None]
+
+    if missing:
+        listing = "".join(
+            f"""
+        {n}. Subject: {parsed_emails[i]['subject']}
+           From: {parsed_emails[i]['from']}
+           Preview: {parsed_emails[i]['snippet']}
+"""
+            for n, i in enumerate(missing, start=1)
+        )
+        prompt = f"""Classify each of these {len(missing)} emails as one of: urgent, personal, routine, or spam
+        {listing}
+        Return exactly one label per email, in the same order"""
+        response = client.responses.parse(
+            model=CLASSIFY_MODEL,
+            input=prompt,
+            text_format=Classifications
+        )
+        result = response.output_parsed
+        if result is not None and len(result.labels) == len(missing):
+            for i, label in zip(missing, result.labels):
+                labels[i] = label
+                set_cached_text(CLASSIFY_MODEL, prompts[i], label)
+                if i in vectors:
+                    label_index.add(vectors[i], label)
+    # anything the batch didn't answer gets its own call
+    return [
+        label.strip().lower() if label is not None else cached_output_text(CLASSIFY_MODEL, prompts[i]).strip().lower()
+        for i, label in enumerate(labels)
+    ]
+
+mimetypes.init() # load the system type map at import, not on the first send
+
+@functools.lru_cache(maxsize=256)
+def _guess_mime_type(filename: str) -> Optional[str]:
+    """mimetypes.guess_type(filename)[0], memoized since the same attachments get sent repeatedly"""
+    return mimetypes.guess_type(filename)[0]
+
+def classify_and_reply(parsed_email: dict) -> Optional[dict]:
+    """
+    Classify an email and draft its reply in one structured-output call, shared by the
+    real and demo clients. None when the response couldn't be parsed
+    """
+    prompt = f"""Classify this email as one of: urgent, personal, routine, or spam.
+        Unless it is urgent, also write a professional and polite reply to it.
+
+        From: {parsed_email['from']}
+        Subject: {parsed_email['subject']}
+        Preview: {parsed_email['snippet']}
+        Body: {parsed_email['body']}
+
+        The reply is ONLY the body of the email, no subject line or headers, starting directly with the greeting.
+        Keep it concise but helpful. Leave the reply empty for urgent emails."""
+    response = client.responses.parse(
+        model=CLASSIFY_MODEL,
+        input=prompt,
+        text_format=ClassifiedReply
+    )
+    result = response.output_parsed
+    if result is None:
+        return None
+    return {"classification": result.classification, "reply": result.reply or None}
+
+SMART_REPLY_MODEL = "gpt-4o-mini"
+# Hard cap on top of the prompt's "concise", a reply is a few paragraphs at most
+SMART_REPLY_MAX_TOKENS = 800
+
+SMART_REPLY_TONES = {
+    'professional': 'Write a professional and polite reply.',
+    'casual': 'Write a casual and friendly reply.',
+    'friendly': 'Write a warm and friendly reply.',
+    'brief': 'Write a very brief and concise reply (2-3 sentences max).',
+}
+
+def smart_reply_prompt(parsed_email: dict) -> str:
+    """Reply prompt for generate_smart_reply, tone and instructions come from the parsed email"""
+    tone_instruction = SMART_REPLY_TONES.get(parsed_email.get('tone', 'professional'), SMART_REPLY_TONES["professional"])
+    custom_instructions = parsed_email.get('instructions', '')
+    return f"""Generate ONLY the body of an email reply. Do NOT include subject line or headers.
+
+        From: {parsed_email['from']}
+        Subject: {parsed_email['subject']}
+        Body: {parsed_email['body']}
+
+        {tone_instruction}
+        {custom_instructions}
+
+        Based on the sender and content, write a helpful reply. Keep it concise but helpful. 
+        Write ONLY the reply body text with appropriate tone. Start directly with the greeting."""
+
+def stream_smart_reply(parsed_email: dict) -> Iterator[str]:
+    """Text deltas of a smart reply as the model produces them, for a streaming response"""
+    with client.responses.create(
+        model=SMART_REPLY_MODEL,
+        input=smart_reply_prompt(parsed_email),
+        max_output_tokens=SMART_REPLY_MAX_TOKENS,
+        stream=True
+    ) as stream:
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+
+class OrjsonModel(JsonModel):
+    """
+    JsonModel that decodes responses with orjson, a full format message is a large
+    JSON document (the whole MIME tree) and json.loads dominated its parse time
+    """
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode("utf-8") if isinstance(content, bytes) else content
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+# token path -> credentials, token.json is read and parsed once per process
+_creds_cache: Dict[str, Credentials] = {}
+_creds_lock = threading.Lock()
+
+def load_credentials(credentials_path: str, token_path: str) -> Credentials:
+    """
+    OAuth credentials for token_path, loaded from disk (or a new consent flow) once per process.
+    An expired access token isn't refreshed here, AuthorizedHttp and get_messages_async
+    refresh it on first use. The token file is only written after a consent flow
+    """
+    with _creds_lock:
+        creds = _creds_cache.get(token_path)
+        if creds is None and os.path.exists(token_path):
+            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+        if not creds or not (creds.valid or creds.refresh_token):
+            flow = InstalledAppFlow.from_client_secrets_file(
+                credentials_path, SCOPES
+            )
+            creds = flow.run_local_server(port=0)
+            with open (token_path, 'w') as file:
+                file.write(creds.to_json())
+        _creds_cache[token_path] = creds
+        return creds
+
+def _is_transient(exception: Exception) -> bool:
+    """Rate limits, server errors and transport failures can succeed on a retry, other HTTP errors won't"""
+    if isinstance(exception, HttpError):
+        return exception.resp.status == 429 or exception.resp.status >= 500
+    return True
+
 class GmailClient:
     def __init__(self, credentials_path: str="credentials.json", token_path: str="token.json"):
         """
@@ -43,23 +282,46 @@ class GmailClient:
         """
         self.credentials_path = credentials_path
         self.token_path = token_path
-        creds = None
-        if os.path.exists(token_path):
-            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_path, SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-            with open (token_path, 'w') as file:
-                file.write(creds.to_json())
+        creds = load_credentials(credentials_path, token_path)
+
+        self.creds = creds
+        self._parsed_cache = LRUCache(maxsize=PARSED_CACHE_SIZE) # message id -> parse_message result
+        self._local = threading.local() # per-thread service, see service
+
+    @property
+    def service(self):
+        """
+        Gmail API service for the calling thread, built on its first use. httplib2 connections
+        aren't thread-safe, so the agent thread, background sends and bulk send workers each
+        get their own authorized connection over the shared credentials
+        """
+        service = getattr(self._local, "service", None)
+        if service is None:
+            http = AuthorizedHttp(self.creds, http=build_http())
+            # Discovery document bundled with the library, never fetched over the network
+            service = self._local.service = build("gmail", "v1", http=http, static_discovery=True, model=OrjsonModel())
+        return service
 
-        self.service = build("gmail", "v1", credentials=creds)
-        self.profile = self.service.users().getProfile(userId="me").execute()
-        self.from_address = self.profile["emailAddress"]
+    @functools.cached_property
+    def from_address(self) -> str:
+        """
+        Address of the signed in account. getProfile runs once, the address is then
+        kept in the token file (a re-auth rewrites that file and drops it)
+        """
+        try:
+            with open(self.token_path) as file:
+                token_info = json.load(file)
+        except (OSError, ValueError):
+            token_info = None
+        if token_info and token_info.get("email_address"):
+            return token_info["email_address"]
+
+        address = self.service.users().getProfile(userId="me").execute()["emailAddress"]
+        if token_info is not None:
+            token_info["email_address"] = address
+            with open(self.token_path, 'w') as file:
+                json.dump(token_info, file)
+        return address
         
 
     def list_messages(self, max_results: int = 10, query: str = '') -> list:
@@ -96,6 +358,129 @@ class GmailClient:
             id=message_id,
             format='full'
         ).execute()
+
+    def get_message_metadata(self, message_id: str) -> dict:
+        """
+        Returns headers (METADATA_HEADERS), snippet and labels of an email without its body,
+        a few KB instead of the whole MIME tree. Use get_message when the body is needed
+
+        :param message_id: The unique identifier of the email
+        :type message_id: str
+        :return: Message data in metadata format
+        :rtype: dict
+        """
+        return self.service.users().messages().get(
+            userId="me",
+            id=message_id,
+            format='metadata',
+            metadataHeaders=METADATA_HEADERS
+        ).execute()
+
+    def get_messages_batch(self, message_ids: List[str], fmt: str = 'full') -> Dict[str, dict]:
+        """
+        Fetch many messages using Gmail batch requests, BATCH_SIZE per HTTP call
+        instead of one round trip per message. Messages that failed with a transient
+        error (429, 5xx, transport) are retried one by one on RETRY_WORKERS threads,
+        permanent ones (e.g. 404 for a deleted message) are not
+
+        :param message_ids: ids of the messages to fetch
+        :type message_ids: List[str]
+        :param fmt: Gmail message format (full, metadata, minimal, raw)
+        :type fmt: str
+        :return: {message_id: message data}, messages that still failed are left out
+        :rtype: Dict[str, dict]
+        """
+        extra = {'metadataHeaders': METADATA_HEADERS} if fmt == 'metadata' else {}
+        messages = self.service.users().messages()
+        fetched = {}
+        retryable = set()
+        failed = self._execute_batch([
+            (message_id, messages.get(userId='me', id=message_id, format=fmt, **extra))
+            for message_id in dict.fromkeys(message_ids)
+        ], responses=fetched, retryable=retryable)
+
+        for failure in failed:
+            if failure["email_id"] not in retryable:
+                print(f"⚠️ Warning: Could not fetch message {failure['email_id']}: {failure['error']}")
+        if retryable:
+            def get_one(message_id: str) -> dict:
+                # self.service is per thread, each worker gets its own connection
+                return self.service.users().messages().get(userId='me', id=message_id, format=fmt, **extra).execute(num_retries=2)
+
+            with ThreadPoolExecutor(max_workers=min(RETRY_WORKERS, len(retryable))) as pool:
+                futures = {message_id: pool.submit(get_one, message_id) for message_id in retryable}
+            for message_id, future in futures.items():
+                try:
+                    fetched[message_id] = future.result()
+                except Exception as e:
+                    print(f"⚠️ Warning: Could not fetch message {message_id}: {e}")
+        return fetched
+
+    def get_parsed_messages(self, message_ids: List[str]) -> Dict[str, dict]:
+        """
+        Fetch and parse many messages, only ids missing from the parsed cache are
+        fetched (with get_messages_batch). Emails that failed processing get
+        re-polled, so they don't pay the fetch and body decode again.
+        The returned dicts are shared with the cache, don't modify them
+
+        :param message_ids: ids of the messages to fetch
+        :type message_ids: List[str]
+        :return: {message_id: parsed message}, messages that failed to fetch or parse are left out
+        :rtype: Dict[str, dict]
+        """
+        parsed = {mid: self._parsed_cache[mid] for mid in message_ids if mid in self._parsed_cache}
+        missing = [mid for mid in message_ids if mid not in parsed]
+        if missing:
+            for message_id, message in self.get_messages_batch(missing).items():
+                try:
+                    parsed[message_id] = self._parsed_cache[message_id] = self.parse_message(message)
+                except Exception as e:
+                    print(f"⚠️ Warning: Could not parse message {message_id}: {e}")
+        return parsed
+
+    async def get_messages_async(self, message_ids: List[str], fmt: str = 'full', concurrency: int = 20) -> Dict[str, dict]:
+        """
+        Fetch many messages concurrently from the Gmail REST API, at most
+        `concurrency` requests in flight over one pooled connection set.
+        Uses httpx with the OAuth bearer token rather than self.service,
+        whose httplib2 transport can't be shared by concurrent requests
+
+        :param message_ids: ids of the messages to fetch
+        :type message_ids: List[str]
+        :param fmt: Gmail message format (full, metadata, minimal, raw)
+        :type fmt: str
+        :param concurrency: max requests in flight
+        :type concurrency: int
+        :return: {message_id: message data}, failed messages are left out
+        :rtype: Dict[str, dict]
+        """
+        if not self.creds.valid:
+            # the refresh is a blocking HTTP call, keep it off the event loop
+            await asyncio.to_thread(self.creds.refresh, Request())
+        message_ids = list(dict.fromkeys(message_ids))
+        params = {"format": fmt}
+        if fmt == 'metadata':
+            params["metadataHeaders"] = METADATA_HEADERS
+        semaphore = asyncio.Semaphore(concurrency)
+        fetched = {}
+
+        async with httpx.AsyncClient(
+            base_url=GMAIL_API_URL,
+            headers={"Authorization": f"Bearer {self.creds.token}"},
+            timeout=30
+        ) as http:
+            async def get_one(message_id: str):
+                async with semaphore:
+                    response = await http.get(f"/messages/{message_id}", params=params)
+                response.raise_for_status()
+                fetched[message_id] = orjson.loads(response.content)
+
+            results = await asyncio.gather(*(get_one(mid) for mid in message_ids), return_exceptions=True)
+
+        for message_id, result in zip(message_ids, results):
+            if isinstance(result, Exception):
+                print(f"⚠️ Warning: Could not fetch message {message_id}: {result}")
+        return fetched
         
     def parse_message(self, message: dict) -> dict:
         """
@@ -115,18 +500,18 @@ class GmailClient:
             'threadId': message['threadId'],
             'snippet': html.unescape(message.get('snippet', ''))
         }
-        keys = ["subject","from", "to", "date"]
+        wanted = {}
         for header in headers:
             name = header["name"].lower()
-            if name in keys:
-                if name == "from":
-                    name, addr = parseaddr(header["value"])
-
-                    parsed["from"] = addr.lower().strip()     # normalized email
-                    parsed["name"] = name.strip()                # optional
-                    parsed["from-raw"] = header["value"]  
-                else:
-                    parsed[name] = header["value"]
+            if name in PARSED_HEADERS:
+                wanted[name] = header["value"]
+        parsed.update(wanted)
+        if "from" in wanted:
+            name, addr = parseaddr(wanted["from"])
+
+            parsed["from"] = addr.lower().strip()     # normalized email
+            parsed["name"] = name.strip()                # optional
+            parsed["from-raw"] = wanted["from"]
         parsed["body"] = self._get_body(message['payload'])
 
         return parsed
@@ -140,18 +525,27 @@ class GmailClient:
         :return: Classification of the email as either 'urgent', 'personal', 'routine', or 'spam'
         :rtype: str
         """
-        prompt = f"""Classify this email as one of: urgent, personal, routine, or spam
+        return cached_output_text(CLASSIFY_MODEL, classification_prompt(parsed_email)).strip().lower()
 
-                Subject: {parsed_email['subject']}
-                From: {parsed_email['from']}
-                Preview: {parsed_email['snippet']}
+    def classify_emails_batch(self, parsed_emails: List[dict]) -> List[str]:
+        """Classify several emails with one OpenAI call, see classify_emails_batch"""
+        return classify_emails_batch(parsed_emails)
 
-                Respond with just one word: urgent, personal, routine, or spam"""
-        response = client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt
-        )
-        return response.output_text.strip().lower()
+    def classify_and_reply(self, parsed_email: dict) -> dict:
+        """Classify an email and draft a reply in one OpenAI call
+
+        Used when the reply is likely needed (whitelisted senders), saves the
+        second round trip of classify_email + generate_smart_reply
+
+        :param parsed_email: Parsed email dict with subject, from, snippet and body
+        :type parsed_email: dict
+        :return: {'classification': ..., 'reply': ...}, reply is empty for urgent emails
+        :rtype: dict
+        """
+        result = classify_and_reply(parsed_email)
+        if result is None:
+            return {"classification": self.classify_email(parsed_email), "reply": None}
+        return result
 
     def generate_reply_suggestions(self, parsed_email: dict) -> list:
         """
@@ -170,47 +564,25 @@ class GmailClient:
             
             Return the response in a list
         """
-        response = client.responses.parse(
-            model="gpt-4o-mini",
-            input=prompt,
-            text_format=PotentialReplies
-        )
-        if response.output_parsed:
-            return [response.output_parsed.casual, response.output_parsed.professional, response.output_parsed.detailed]
+        replies = cached_output_parsed("gpt-4o-mini", prompt, PotentialReplies)
+        if replies:
+            return [replies.casual, replies.professional, replies.detailed]
         return []
     
     def generate_smart_reply(self, parsed_email: dict) -> str:
         """Generate a single, contextually appropriate reply with tone support"""
-        
-        tone = parsed_email.get('tone', 'professional')
-        custom_instructions = parsed_email.get('instructions', '')
-        # Tone mappings
-        tone_instructions = {
-            'professional': 'Write a professional and polite reply.',
-            'casual': 'Write a casual and friendly reply.',
-            'friendly': 'Write a warm and friendly reply.',
-            'brief': 'Write a very brief and concise reply (2-3 sentences max).',
-        }
-        tone_instruction = tone_instructions.get(tone, tone_instructions["professional"])
-        prompt = f"""Generate ONLY the body of an email reply. Do NOT include subject line or headers.
-
-        From: {parsed_email['from']}
-        Subject: {parsed_email['subject']}
-        Body: {parsed_email['body']}
-
-        {tone_instruction}
-        {custom_instructions}
-
-        Based on the sender and content, write a helpful reply. Keep it concise but helpful. 
-        Write ONLY the reply body text with appropriate tone. Start directly with the greeting."""
-
         response = client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt
+            model=SMART_REPLY_MODEL,
+            input=smart_reply_prompt(parsed_email),
+            max_output_tokens=SMART_REPLY_MAX_TOKENS
         )
     
         return response.output_text
 
+    def generate_smart_reply_stream(self, parsed_email: dict) -> Iterator[str]:
+        """generate_smart_reply, yielding text as it's generated"""
+        return stream_smart_reply(parsed_email)
+
     def send_email(self, to: str, subject: str, body: str, thread_id: Optional[str]=None) -> dict:
         message = EmailMessage()
         message['To'] = to
@@ -239,14 +611,6 @@ class GmailClient:
         thread_id: Optional[str] = None
     ):
         """Send email with file attachments"""
-        from app.services.storage import storage_service
-        import mimetypes
-        from email import encoders
-        from email.mime.base import MIMEBase
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-        import base64
-        
         message = MIMEMultipart()
         message['To'] = to
         message['Subject'] = subject
@@ -255,6 +619,11 @@ class GmailClient:
         msg_text = MIMEText(body, 'plain', 'utf-8')
         message.attach(msg_text)
         
+        # Attachment parts carry a placeholder while the email package renders the envelope,
+        # its generator is slow pure Python over megabytes of base64. The encoded bytes are
+        # spliced in at the placeholders afterwards
+        encoded_payloads = {} # placeholder -> base64 bytes
+        
         # Add attachments
         for filepath, original_filename in attachment_data:
             content = storage_service.get_file_content(filepath)
@@ -263,7 +632,7 @@ class GmailClient:
                 continue
             
             # Guess MIME type
-            mime_type, _ = mimetypes.guess_type(original_filename)
+            mime_type = _guess_mime_type(original_filename)
             if mime_type is None:
                 mime_type = 'application/octet-stream'
             
@@ -271,11 +640,15 @@ class GmailClient:
             
             # Create the attachment
             attachment = MIMEBase(main_type, sub_type)
-            attachment.set_payload(content)
-            encoders.encode_base64(attachment)
+            # base64 straight from the file bytes, encode_base64 would store the raw bytes as the
+            # payload, read them back out and encode from that copy
+            placeholder = uuid.uuid4().hex
+            encoded_payloads[placeholder.encode()] = base64.encodebytes(content)
+            attachment.set_payload(placeholder)
+            attachment['Content-Transfer-Encoding'] = 'base64'
+            del content
             
             # ✅ THE KEY FIX: Properly encode the filename
-            from email.utils import encode_rfc2231
             attachment.add_header(
                 'Content-Disposition',
                 'attachment',
@@ -284,16 +657,30 @@ class GmailClient:
             
             message.attach(attachment)
         
-        # Encode and send
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+        # Placeholders come out in attachment order, one bytes.join builds the message
+        pieces = []
+        rest = message.as_bytes()
+        for placeholder, encoded in encoded_payloads.items():
+            head, rest = rest.split(placeholder, 1)
+            pieces += [head, encoded]
+        pieces.append(rest)
+        
+        # Upload the MIME bytes as-is, a 'raw' field would base64 the whole message again
+        raw_message = b"".join(pieces)
+        media = MediaIoBaseUpload(
+            io.BytesIO(raw_message),
+            mimetype='message/rfc822',
+            resumable=len(raw_message) > RESUMABLE_UPLOAD_THRESHOLD
+        )
         
-        body_data = {'raw': raw_message}
+        body_data = None # plain media upload unless there's metadata to send alongside
         if thread_id:
-            body_data['threadId'] = thread_id
+            body_data = {'threadId': thread_id}
         
         result = self.service.users().messages().send(
             userId='me',
-            body=body_data
+            body=body_data,
+            media_body=media
         ).execute()
         
         print(f"📧 Email sent: {result.get('id')}")
@@ -313,21 +700,92 @@ class GmailClient:
                     body={'removeLabelIds': ['INBOX']}
                 ).execute()
 
+    def batch_modify(self, message_ids: List[str], body: dict) -> List[dict]:
+        """
+        Apply the same label change to many messages using Gmail batch requests
+
+        :param message_ids: ids of the messages to modify
+        :type message_ids: List[str]
+        :param body: modify request body, e.g. {'removeLabelIds': ['INBOX']}
+        :type body: dict
+        :return: failures as [{"email_id": ..., "error": ...}]
+        :rtype: List[dict]
+        """
+        messages = self.service.users().messages()
+        return self._execute_batch([
+            (message_id, messages.modify(userId='me', id=message_id, body=body))
+            for message_id in dict.fromkeys(message_ids)
+        ])
+
+    def batch_trash(self, message_ids: List[str]) -> List[dict]:
+        """
+        Move many messages to trash using Gmail batch requests
+
+        :param message_ids: ids of the messages to trash
+        :type message_ids: List[str]
+        :return: failures as [{"email_id": ..., "error": ...}]
+        :rtype: List[dict]
+        """
+        messages = self.service.users().messages()
+        return self._execute_batch([
+            (message_id, messages.trash(userId='me', id=message_id))
+            for message_id in dict.fromkeys(message_ids)
+        ])
+
+    def _execute_batch(self, requests: List[tuple], responses: Optional[dict] = None, retryable: Optional[set] = None) -> List[dict]:
+        """
+        Send (message_id, request) pairs in chunks of BATCH_SIZE and collect failures,
+        successful responses are stored in responses (keyed by message id) when given.
+        Ids of failures worth retrying are added to retryable when given
+        """
+        failed = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                failed.append({"email_id": request_id, "error": str(exception)})
+                if retryable is not None and _is_transient(exception):
+                    retryable.add(request_id)
+            elif responses is not None:
+                responses[request_id] = response
+
+        for start in range(0, len(requests), BATCH_SIZE):
+            chunk = requests[start:start + BATCH_SIZE]
+            batch = self.service.new_batch_http_request(callback=callback)
+            for message_id, request in chunk:
+                batch.add(request, request_id=message_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                # the whole chunk failed to send
+                failed.extend({"email_id": message_id, "error": str(e)} for message_id, _ in chunk)
+                if retryable is not None and _is_transient(e):
+                    retryable.update(message_id for message_id, _ in chunk)
+
+        return failed
+
     def _get_body(self, payload: dict) -> str:
         if 'body' in payload and 'data' in payload['body']:
             return self._decode_body(payload['body']['data'])
         if 'parts' in payload:
+            # One pass: plain text wins, the first html part is the fallback
+            html_data = None
             for part in payload['parts']:
-                if part.get('mimeType') == 'text/plain':
-                    if 'data' in part.get('body', {}):
-                        return self._decode_body(part['body']['data'])
-            for part in payload['parts']:
-                if part.get('mimeType') == 'text/html':
-                    if 'data' in part.get('body', {}):
-                        return self._decode_body(part['body']['data'])
+                data = part.get('body', {}).get('data')
+                if data is None:
+                    continue
+                mime_type = part.get('mimeType')
+                if mime_type == 'text/plain':
+                    return self._decode_body(data)
+                if mime_type == 'text/html' and html_data is None:
+                    html_data = data
+            if html_data is not None:
+                return self._decode_body(html_data)
         return 'Could not extract body'
 
     def _decode_body(self, body: str) -> str:
-        decoded_bytes = base64.urlsafe_b64decode(body)
-        text = decoded_bytes.decode('utf-8')
-        return text.replace('\r\n', '\n').replace('\r', '\n')
+        data = body.encode('ascii').translate(_URLSAFE_TRANSLATION)
+        data += b'=' * (-len(data) % 4) # tolerate unpadded data instead of raising
+        # lenient on purpose: one part with invalid UTF-8 shouldn't fail the whole parse,
+        # that email would be skipped on every poll. Bad bytes become U+FFFD
+        text = base64.b64decode(data).decode('utf-8', errors='replace')
+        return _NEWLINE_RE.sub('\n', text)
@@ -1,8 +1,16 @@
+import threading
 from app.core.config import settings
 from app.services.gmail_client import GmailClient
 from app.services.demo_gmail_client import DemoGmailClient
 
+_client = None
+_client_lock = threading.Lock()
+
 def get_gmail_client():
-    if settings.demo_mode:
-        return DemoGmailClient()
-    return GmailClient()
\ No newline at end of file
+    """Shared Gmail client, built once per process even if first requested from several threads"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DemoGmailClient() if settings.demo_mode else GmailClient()
+    return _client
@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import httpx
+from cachetools import TTLCache
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from pydantic import BaseModel
+from typing import Optional, Type, TypeVar
+from app.core.config import settings
+
+# One connection pool per client for the whole process, instead of one per module.
+# Sized for the agent's concurrent poll (MAX_CONCURRENT_LLM_CALLS) plus on-demand API calls
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=16)
+
+# The SDK default waits up to 10 minutes for a response. Compose with attachments on a
+# reasoning model is the slowest call we make and stays well under this
+_TIMEOUT = httpx.Timeout(60, connect=5)
+
+# Blocking calls: agent loop, gmail clients, AI compose
+client = OpenAI(
+    api_key=settings.openai_api_key,
+    timeout=_TIMEOUT,
+    max_retries=2,
+    http_client=DefaultHttpxClient(limits=_LIMITS)
+)
+
+# `async def` routes (chat)
+async_client = AsyncOpenAI(
+    api_key=settings.openai_api_key,
+    timeout=_TIMEOUT,
+    max_retries=2,
+    http_client=DefaultAsyncHttpxClient(limits=_LIMITS)
+)
+
+# Deterministic-enough completions (classification, suggestions) keyed by model + prompt,
+# the same email gets classified again whenever its poll is retried
+_response_cache: TTLCache = TTLCache(maxsize=2048, ttl=24 * 3600)
+_response_lock = threading.Lock() # the agent calls these from its LLM thread pool
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+def _cache_key(namespace: str, model: str, prompt: str) -> str:
+    return f"{namespace}:{model}:" + hashlib.sha256(prompt.encode()).hexdigest()
+
+def get_cached_text(model: str, prompt: str) -> Optional[str]:
+    """Cached output_text for this exact prompt, None on a miss"""
+    with _response_lock:
+        return _response_cache.get(_cache_key("text", model, prompt))
+
+def set_cached_text(model: str, prompt: str, text: str):
+    """Store output_text for a prompt, e.g. one answer taken out of a batched call"""
+    with _response_lock:
+        _response_cache[_cache_key("text", model, prompt)] = text
+
+def cached_output_text(model: str, prompt: str) -> str:
+    """responses.create(...).output_text, served from the cache for a repeated prompt"""
+    text = get_cached_text(model, prompt)
+    if text is None:
+        text = client.responses.create(model=model, input=prompt).output_text
+        set_cached_text(model, prompt, text)
+    return text
+
+def cached_output_parsed(model: str, prompt: str, text_format: Type[ModelT]) -> Optional[ModelT]:
+    """responses.parse(...).output_parsed, cached as its dump so callers get a fresh instance"""
+    key = _cache_key(text_format.__name__, model, prompt)
+    with _response_lock:
+        dumped = _response_cache.get(key)
+    if dumped is None:
+        parsed = client.responses.parse(model=model, input=prompt, text_format=text_format).output_parsed
+        if parsed is None:
+            return None
+        dumped = parsed.model_dump()
+        with _response_lock:
+            _response_cache[key] = dumped
+    return text_format.model_validate(dumped)
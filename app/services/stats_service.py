@@ -0,0 +1,73 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text, table, column
+from cachetools import TTLCache
+from typing import Callable, TypeVar
+import logging
+import threading
+
+from app.database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# Dashboard polls far more often than emails arrive, stats are reused for up to 30s
+_stats_cache: TTLCache = TTLCache(maxsize=64, ttl=30)
+_stats_lock = threading.Lock()
+
+# Materialized views behind the histograms on Postgres, see the fa581fc16ffd migration
+mv_email_classification = table("mv_email_classification", column("classification"), column("count"))
+mv_action_types = table("mv_action_types", column("action_type"), column("count"))
+mv_top_senders = table("mv_top_senders", column("from_address"), column("count"))
+
+StatsT = TypeVar("StatsT")
+
+def cached_stats(user_id: int, compute: Callable[[], StatsT]) -> StatsT:
+    """Stats for a user from the cache, computed and stored on a miss"""
+    with _stats_lock:
+        stats = _stats_cache.get(user_id)
+    if stats is None:
+        stats = compute()
+        with _stats_lock:
+            _stats_cache[user_id] = stats
+    return stats
+
+# The histogram views are refreshed on this schedule, never on the dashboard read path
+STATS_REFRESH_INTERVAL = 60
+
+# Any bigint works, it just has to be the same in every worker
+_REFRESH_LOCK_KEY = 0x6d765f72 # "mv_r"
+
+def refresh_stats_views(db: Session):
+    """
+    Recompute the dashboard materialized views, no-op outside Postgres. With several
+    workers on the same schedule only the one holding the advisory lock refreshes
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _REFRESH_LOCK_KEY}).scalar():
+        db.rollback()
+        return
+    for view in (mv_email_classification, mv_action_types, mv_top_senders):
+        db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view.name}"))
+    db.commit()
+    with _stats_lock:
+        _stats_cache.clear()
+
+def run_stats_refresher(stop_event: threading.Event, interval: int = STATS_REFRESH_INTERVAL):
+    """Refresh the views every interval seconds until stop_event is set, runs on its own thread"""
+    if engine.dialect.name != "postgresql":
+        return
+    while True:
+        db = SessionLocal()
+        try:
+            refresh_stats_views(db)
+        except Exception:
+            logger.exception("Error refreshing dashboard stats views")
+        finally:
+            db.close()
+        if stop_event.wait(interval):
+            return
+
+def invalidate_stats_cache():
+    """Drop this process's cached stats after emails or actions change"""
+    with _stats_lock:
+        _stats_cache.clear()
@@ -1,10 +1,14 @@
 import os
 import uuid
 import shutil
-from typing import Optional, List
+import aiofiles
+from typing import Optional, List, Union
 from pathlib import Path
 from fastapi import UploadFile
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024 # fewer thread-pool hops (aiofiles + UploadFile.read) per upload
+EXCLUSIVE_CREATE_FLAGS = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0)
+
 class StorageService:
     """
     File storage abstraction layer
@@ -54,15 +58,13 @@ class StorageService:
         filepath = user_dir / filename
 
         # Save content
-        content = await file.read()
-        with open(filepath, "wb") as f:
-            f.write(content)
+        size = await self._stream_to_disk(file, filepath)
 
         return {
             "filename": filename,
             "original_filename": file.filename,
             "filepath": str(filepath),
-            "size": len(content),
+            "size": size,
             "type": "user_file"
         }
     
@@ -77,42 +79,51 @@ class StorageService:
         filename = file.filename if file.filename else ""
         filepath = draft_dir / filename
 
-        counter = 1
-        while filepath.exists():
-            stem = Path(file.filename if file.filename else "").stem
-            ext = Path(file.filename if file.filename else "").suffix
-            filename = f"{stem}_{counter}{ext}"
+        # O_EXCL creates the file atomically, so concurrent uploads of the same name can't clobber each other
+        try:
+            fd = os.open(filepath, EXCLUSIVE_CREATE_FLAGS, 0o644)
+        except FileExistsError:
+            stem = Path(filename).stem
+            ext = Path(filename).suffix
+            filename = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
             filepath = draft_dir / filename
-            counter += 1
+            fd = os.open(filepath, EXCLUSIVE_CREATE_FLAGS, 0o644)
 
         # Save file
-        content = await file.read()
-        with open(filepath, 'wb') as f:
-            f.write(content)
+        size = await self._stream_to_disk(file, fd)
         
         return {
             "filename": filename,
             "original_filename": file.filename,
             "filepath": str(filepath),
-            "size": len(content),
+            "size": size,
             "type": "draft_attachment"
         }
     
+    async def _stream_to_disk(self, file: UploadFile, target: Union[Path, int]) -> int:
+        """Write an upload to a path or open fd in chunks so it's never fully in memory, returns bytes written"""
+        size = 0
+        async with aiofiles.open(target, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
+                size += len(chunk)
+        return size
+
     def list_user_files(self, user_id: int) -> List[dict]:
         """List all user's persistent files"""
         user_dir = self.get_user_files_path(user_id=user_id)
-        files = []
-
-        for filepath in user_dir.iterdir():
-            if filepath.is_file():
-                files.append({
-                    "filename": filepath.name,
-                    "filepath": str(filepath),
-                    "size": filepath.stat().st_size,
-                    "type": "user_file"
-                })
 
-        return files
+        # scandir's is_file() answers from the directory listing, only the size needs a stat
+        with os.scandir(user_dir) as entries:
+            return [
+                {
+                    "filename": entry.name,
+                    "filepath": entry.path,
+                    "size": entry.stat().st_size,
+                    "type": "user_file"
+                }
+                for entry in entries if entry.is_file()
+            ]
 
     def delete_file(self, filepath: str) -> bool:
         """Delete a specific file"""
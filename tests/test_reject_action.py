@@ -0,0 +1,56 @@
+import unittest
+
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.action import approve_action
+from app.models import Action
+from app.schemas.action import ActionApprove
+
+
+class RejectActionTest(unittest.TestCase):
+    def setUp(self):
+        # emails has Postgres-only columns, and the reject path never reads it
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        Action.__table__.create(engine)
+        self.db = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_action(self, status: str) -> int:
+        action = Action(email_id="e1", action_type="reply", status=status, suggested_reply="ok")
+        self.db.add(action)
+        self.db.commit()
+        return action.id # type: ignore
+
+    def reject(self, action_id: int):
+        return approve_action(action_id, ActionApprove(approved=False), BackgroundTasks(), self.db)
+
+    def test_rejects_pending(self):
+        action = self.reject(self.add_action("pending"))
+        self.assertEqual(action.status, "rejected")
+        self.db.expire_all()
+        self.assertEqual(self.db.get(Action, action.id).status, "rejected")
+
+    def test_missing_action_is_404(self):
+        with self.assertRaises(HTTPException) as caught:
+            self.reject(12345)
+        self.assertEqual(caught.exception.status_code, 404)
+
+    def test_non_pending_is_400_like_approve(self):
+        for status in ("rejected", "approved", "executed", "failed"):
+            action_id = self.add_action(status)
+            with self.assertRaises(HTTPException) as rejected:
+                self.reject(action_id)
+            with self.assertRaises(HTTPException) as approved:
+                approve_action(action_id, ActionApprove(approved=True), BackgroundTasks(), self.db)
+            self.assertEqual(rejected.exception.status_code, 400)
+            self.assertEqual(approved.exception.status_code, 400)
+            self.assertEqual(self.db.get(Action, action_id).status, status)
+
+
+if __name__ == "__main__":
+    unittest.main()
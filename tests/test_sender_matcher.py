@@ -0,0 +1,40 @@
+import unittest
+
+from app.models.config import SenderMatcher
+
+
+def matcher(*entries: str) -> SenderMatcher:
+    return SenderMatcher(tuple(entries))
+
+
+class SenderMatcherTest(unittest.TestCase):
+    def test_exact_address(self):
+        self.assertTrue(matcher("boss@corp.com").matches("boss@corp.com"))
+        self.assertFalse(matcher("boss@corp.com").matches("other@corp.com"))
+
+    def test_domain_and_subdomains(self):
+        self.assertTrue(matcher("corp.com").matches("a@corp.com"))
+        self.assertTrue(matcher("corp.com").matches("a@mail.corp.com"))
+        self.assertTrue(matcher("@corp.com").matches("a@corp.com"))
+        self.assertFalse(matcher("@corp.com").matches("a@mail.corp.com"))
+
+    def test_leading_dot_suffix(self):
+        self.assertTrue(matcher(".edu").matches("x@mit.edu"))
+        self.assertFalse(matcher(".edu").matches("x@education.com"))
+
+    def test_partial_domain(self):
+        self.assertTrue(matcher("amazon.co").matches("orders@amazon.com"))
+
+    def test_local_part_with_dot(self):
+        self.assertTrue(matcher("john.smith").matches("john.smith@corp.com"))
+
+    def test_fragment(self):
+        self.assertTrue(matcher("noreply@").matches("noreply@github.com"))
+        self.assertFalse(matcher("noreply@").matches("team@github.com"))
+
+    def test_empty(self):
+        self.assertFalse(matcher().matches("a@corp.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()